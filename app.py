@@ -5,6 +5,7 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
+from metrics import TimedQueuePool
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -27,6 +28,8 @@ if not database_url:
     
 app.config["SQLALCHEMY_DATABASE_URI"] = database_url
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+    # A QueuePool that reports connection checkout wait at /metrics
+    "poolclass": TimedQueuePool,
     "pool_recycle": 300,
     "pool_pre_ping": True,
     "pool_timeout": 20,
@@ -34,6 +37,33 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "max_overflow": 20
 }
 
+# Queue prediction rows for batched background inserts instead of writing them
+# inside the request (see write_behind.py)
+app.config["PREDICTION_WRITE_BEHIND"] = os.environ.get("PREDICTION_WRITE_BEHIND") == "1"
+
+# Score concurrent /predict requests together in one forest call (see micro_batch.py);
+# only useful when workers serve requests on several threads
+app.config["PREDICTION_MICRO_BATCH"] = os.environ.get("PREDICTION_MICRO_BATCH") == "1"
+app.config["PREDICTION_BATCH_WINDOW_MS"] = float(os.environ.get("PREDICTION_BATCH_WINDOW_MS", 2))
+app.config["PREDICTION_MAX_BATCH_SIZE"] = int(os.environ.get("PREDICTION_MAX_BATCH_SIZE", 64))
+
+# Seconds a logged-in user's identity is served from memory instead of the
+# database on each request (see user_cache.py); 0 disables the cache
+app.config["USER_CACHE_TTL"] = float(os.environ.get("USER_CACHE_TTL", 60))
+
+# Bearer token required by /metrics; unset leaves it open to the scraper
+app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")
+
+# Bearer token for POST /api/model/reload; unset disables the endpoint
+app.config["MODEL_ADMIN_TOKEN"] = os.environ.get("MODEL_ADMIN_TOKEN")
+
+# SQL statements slower than this are logged with their route; 0 disables
+app.config["SLOW_QUERY_MS"] = float(os.environ.get("SLOW_QUERY_MS", 100))
+
+# Fail requests that run more statements than their route's budget in
+# routes.QUERY_BUDGETS instead of only logging them; meant for tests
+app.config["QUERY_BUDGET_ENFORCE"] = os.environ.get("QUERY_BUDGET_ENFORCE") == "1"
+
 # Initialize extensions
 db.init_app(app)
 login_manager = LoginManager()
@@ -44,21 +74,14 @@ login_manager.login_message_category = 'info'
 
 @login_manager.user_loader
 def load_user(user_id):
-    from models import User
-    return User.query.get(int(user_id))
-
-with app.app_context():
-    # Import models to ensure tables are created
-    import models
-    db.create_all()
-    
-    # Initialize ML model
-    from ml_model import MLModel
-    ml_model = MLModel()
-    ml_model.train_model()
+    from user_cache import load_user as load_cached_user
+    return load_cached_user(int(user_id))
 
-# Import routes
+# Import models, routes and CLI commands. Creating tables and training the
+# model are explicit steps: `flask --app main init-db` and `flask --app main train-model`
+import models
 import routes
+import commands
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,973 @@
+#!/usr/bin/env python3
+"""
+Benchmarks and exactness checks for Employee Salary Prediction App
+Run from the directory holding the trained model and data/employee_data.csv:
+
+    python benchmark.py                 # run every benchmark
+    python benchmark.py fast-path       # run selected benchmarks
+
+For a reproducible, offline run that does not touch the real data or
+model, --synthetic ROWS generates a seeded dataset in a temporary
+directory, trains a model on it and runs there. --json PATH writes every
+result together with the library versions and git commit, so runs can be
+compared:
+
+    python benchmark.py preprocess predict model-load routes \\
+        --synthetic 30000 --rows 100000 --json results.json
+"""
+
+import argparse
+import atexit
+import datetime
+import filecmp
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+
+SAMPLE_RECORD = {
+    'age': 39, 'workclass': 'Private', 'education': 'Bachelors',
+    'marital-status': 'Married-civ-spouse', 'occupation': 'Exec-managerial',
+    'relationship': 'Husband', 'race': 'White', 'gender': 'Male',
+    'hours-per-week': 45, 'native-country': 'United-States',
+}
+
+
+def timed(func, repeat=1):
+    """Return (result, average seconds per call) for func()"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def load_ml_model():
+    """Load the trained model from the working directory"""
+    from ml_model import MLModel
+    ml_model = MLModel()
+    if ml_model.model is None:
+        print("✗ No trained model found. Train one first with MLModel().train_model()")
+        sys.exit(1)
+    return ml_model
+
+
+def load_records(ml_model, limit=None):
+    """Load the training set as a list of input records"""
+    df = ml_model.load_data()
+    if df is None:
+        print("✗ Could not load data/employee_data.csv")
+        sys.exit(1)
+    if limit:
+        df = df.head(limit)
+    return df[ml_model.feature_columns].to_dict('records')
+
+
+def legacy_predict(ml_model, input_data):
+    """The original single-record path: DataFrame, predict and predict_proba"""
+    X_processed = ml_model.preprocess_data(pd.DataFrame([input_data]), is_training=False)
+    prediction = ml_model.model.predict(X_processed)[0]
+    confidence = float(max(ml_model.model.predict_proba(X_processed)[0]))
+    return prediction, confidence
+
+
+def bench_fast_path(args):
+    """Check MLModel.predict against the DataFrame path on the training set"""
+    ml_model = load_ml_model()
+    records = load_records(ml_model, args.limit)
+
+    # Exactness over the whole training set: the batch path runs the
+    # DataFrame encoding and the forest exactly like the original predict
+    expected = ml_model.predict_batch(records)
+    actual = [ml_model.predict(record) for record in records]
+    mismatches = sum(1 for a, b in zip(actual, expected) if a != b)
+
+    sample = records[:args.sample]
+    legacy = [legacy_predict(ml_model, record) for record in sample]
+    mismatches += sum(1 for a, b in zip(actual, legacy) if a != b)
+
+    _, legacy_time = timed(lambda: [legacy_predict(ml_model, r) for r in sample])
+    _, fast_time = timed(lambda: [ml_model.predict(r) for r in sample])
+
+    return {
+        'records_checked': len(records),
+        'mismatches': mismatches,
+        'legacy_ms_per_prediction': legacy_time / len(sample) * 1000,
+        'fast_ms_per_prediction': fast_time / len(sample) * 1000,
+        'speedup': legacy_time / fast_time,
+    }
+
+
+def bench_forest(args):
+    """Compare the sklearn and compiled forest backends across batch sizes"""
+    from forest_engine import CompiledForest
+    ml_model = load_ml_model()
+    records = load_records(ml_model)
+    X_all = ml_model.preprocess_data(pd.DataFrame(records), is_training=False)
+
+    _, compile_time = timed(lambda: CompiledForest.from_sklearn(ml_model.model))
+    compiled = CompiledForest.from_sklearn(ml_model.model)
+
+    rng = np.random.default_rng(42)
+    results = {'compile_seconds': compile_time, 'mismatches': 0}
+    for batch_size in (1, 10, 100, 1000, 10000, 100000):
+        X = X_all.iloc[rng.integers(0, len(X_all), batch_size)]
+        repeat = max(1, 1000 // batch_size)
+        expected, sklearn_time = timed(lambda: ml_model.model.predict_proba(X), repeat)
+        actual, compiled_time = timed(lambda: compiled.predict_proba(X), repeat)
+        if not np.array_equal(expected, actual):
+            results['mismatches'] += 1
+        results[f'batch_{batch_size}_sklearn_ms'] = sklearn_time * 1000
+        results[f'batch_{batch_size}_compiled_ms'] = compiled_time * 1000
+        results[f'batch_{batch_size}_speedup'] = sklearn_time / compiled_time
+    return results
+
+
+def read_memory_kb():
+    """Return this process's Rss and Pss in kB (Linux only)"""
+    memory = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('Rss', 'Pss'):
+                memory[key.lower()] = int(value.split()[0])
+    return memory
+
+
+def _measure_worker(mode, barrier, results):
+    """Load the model the way a gunicorn worker would and report its memory"""
+    logging.disable(logging.INFO)
+    from ml_model import MLModel
+    models = []
+    if mode == 'per-module':
+        # Before the registry: app.py and routes.py each loaded their own model
+        models = [MLModel(), MLModel()]
+    elif mode == 'shared-mmap':
+        os.environ['MODEL_LOAD_MODE'] = 'mmap'
+        from model_registry import get_model
+        models = [get_model()]
+    for ml_model in models:
+        ml_model.predict(SAMPLE_RECORD)
+    # Measure while every worker is alive so that Pss splits shared pages
+    barrier.wait()
+    results.put((mode, read_memory_kb()))
+    barrier.wait()
+
+
+def bench_workers(args):
+    """Memory per worker: two in-process models vs one shared memory-mapped model"""
+    from ml_model import MLModel
+    # Compile the forest files up front so the workers only map them
+    MLModel(backend='compiled', load_mode='mmap')
+
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for mode in ('imports-only', 'per-module', 'shared-mmap'):
+        barrier = context.Barrier(args.workers)
+        queue = context.Queue()
+        workers = [context.Process(target=_measure_worker, args=(mode, barrier, queue))
+                   for _ in range(args.workers)]
+        for worker in workers:
+            worker.start()
+        memory = [queue.get()[1] for _ in workers]
+        for worker in workers:
+            worker.join()
+        for key in ('rss', 'pss'):
+            results[f'{mode}_{key}_mb'] = sum(m[key] for m in memory) / len(memory) / 1024
+    for key in ('rss', 'pss'):
+        results[f'model_{key}_saved_mb'] = (results[f'per-module_{key}_mb']
+                                           - results[f'shared-mmap_{key}_mb'])
+    return results
+
+
+STARTUP_SCRIPT = """
+import json, logging, sys, time
+start = time.perf_counter()
+from app import app, db
+imported = time.perf_counter()
+logging.disable(logging.INFO)
+from models import User
+with app.app_context():
+    db.create_all()
+    user = User(username='benchmark', email='benchmark@example.com')
+    user.set_password('benchmark')
+    db.session.add(user)
+    db.session.commit()
+    user_id = user.id
+client = app.test_client()
+with client.session_transaction() as session:
+    session['_user_id'] = str(user_id)
+ready = time.perf_counter()
+response = client.post('/api/predict/batch', json=[RECORD])
+assert response.status_code == 200, response.get_data(as_text=True)
+answered = time.perf_counter()
+print(json.dumps({'import_seconds': imported - start,
+                  'first_prediction_seconds': answered - ready}))
+"""
+
+
+def bench_startup(args):
+    """App import time and time to the first prediction request, in fresh processes"""
+    record = {'age': 39, 'workclass': 'Private', 'education': 'Bachelors',
+              'marital_status': 'Married-civ-spouse', 'occupation': 'Exec-managerial',
+              'relationship': 'Husband', 'race': 'White', 'gender': 'Male',
+              'hours_per_week': 45, 'native_country': 'United-States'}
+    script = STARTUP_SCRIPT.replace('RECORD', repr(record))
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for _ in range(args.repeat):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, PYTHONPATH=package_dir,
+                       DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'benchmark.db')}")
+            output = subprocess.run([sys.executable, '-c', script], env=env, check=True,
+                                    capture_output=True, text=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: min(run[key] for run in runs) for key in runs[0]}
+
+
+INGEST_SCRIPT = """
+import json, logging, resource, sys, time
+import numpy as np
+import pandas as pd
+from ml_model import MLModel
+logging.disable(logging.INFO)
+path, mode = sys.argv[1], sys.argv[2]
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+if mode == 'legacy':
+    # The original MLModel.load_data
+    df = pd.read_csv(path)
+    df = df.replace('?', np.nan)
+    df = df.dropna()
+    for col in df.columns:
+        if df[col].dtype == 'object':
+            df[col] = df[col].str.strip()
+else:
+    # Run from a directory without model files, so only the loader is measured
+    df = MLModel().load_data(path)
+elapsed = time.perf_counter() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'rows': len(df), 'seconds': elapsed, 'peak_mb': peak / 1024,
+                  'growth_mb': (peak - before) / 1024,
+                  'frame_mb': df.memory_usage(deep=True).sum() / 2**20}))
+"""
+
+
+def write_scaled_dataset(source, target, scale):
+    """Write the source CSV's rows `scale` times over into target"""
+    with open(source) as f:
+        header = f.readline()
+        rows = f.read()
+    if not rows.endswith('\n'):
+        rows += '\n'
+    with open(target, 'w') as f:
+        f.write(header)
+        for _ in range(scale):
+            f.write(rows)
+
+
+def bench_ingest(args):
+    """Peak memory of the original vs the chunked CSV loader on a scaled-up dataset"""
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'employee_data.csv')
+        write_scaled_dataset('data/employee_data.csv', path, args.scale)
+        results['csv_mb'] = os.path.getsize(path) / 2**20
+        for mode in ('legacy', 'chunked'):
+            env = dict(os.environ, PYTHONPATH=package_dir)
+            output = subprocess.run([sys.executable, '-c', INGEST_SCRIPT, path, mode], env=env,
+                                    cwd=tmp, check=True, capture_output=True, text=True).stdout
+            for key, value in json.loads(output.strip().splitlines()[-1]).items():
+                results[f'{mode}_{key}'] = value
+    # A small input may not raise the chunked loader's peak RSS at all
+    results['peak_reduction'] = (results['legacy_growth_mb'] / results['chunked_growth_mb']
+                                 if results['chunked_growth_mb'] > 0 else None)
+    return results
+
+
+def bench_training_matrix(args):
+    """Time building the encoded training matrix vs reloading it from the cache"""
+    from ml_model import MLModel
+    ml_model = MLModel()
+    (X, y), build_time = timed(lambda: ml_model.prepare_training_data(use_cache=False))
+    key = ml_model.training_matrix_key()
+    _, key_time = timed(ml_model.training_matrix_key)
+    ml_model.save_training_matrix(key, X, y)
+    (X_cached, y_cached), load_time = timed(lambda: ml_model.prepare_training_data())
+    mismatches = int(not (np.array_equal(X.to_numpy(), X_cached.to_numpy())
+                          and np.array_equal(y.to_numpy(), y_cached.to_numpy())))
+    return {
+        'rows': len(X),
+        'mismatches': mismatches,
+        'build_seconds': build_time,
+        'cached_seconds': load_time,
+        'hash_seconds': key_time,
+        'speedup': build_time / load_time,
+    }
+
+
+_benchmark_db = {}
+
+
+def benchmark_app(rows=0, users=100):
+    """Import the app against a throwaway SQLite database seeded with predictions.
+
+    The heaviest user (id 1) owns a tenth of the rows; the rest are spread
+    over the other users. The database is seeded once per run.
+    """
+    if 'app' not in _benchmark_db:
+        tmp = tempfile.mkdtemp(prefix='salary-benchmark-')
+        atexit.register(shutil.rmtree, tmp, ignore_errors=True)
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'benchmark.db')}"
+        from app import app, db
+        logging.disable(logging.INFO)
+        with app.app_context():
+            db.create_all()
+        _benchmark_db.update(app=app, db=db, rows=0)
+    app, db = _benchmark_db['app'], _benchmark_db['db']
+    if rows > _benchmark_db['rows']:
+        with app.app_context():
+            seed_predictions(db, rows - _benchmark_db['rows'], users)
+        _benchmark_db['rows'] = rows
+    return app, db
+
+
+def seed_predictions(db, rows, users):
+    """Bulk insert synthetic users and predictions through the raw DB-API connection"""
+    from models import User
+    for user_id in range(1, users + 1):
+        if db.session.get(User, user_id) is None:
+            user = User(id=user_id, username=f'user{user_id}', email=f'user{user_id}@example.com')
+            user.set_password('benchmark')
+            db.session.add(user)
+    db.session.commit()
+
+    rng = random.Random(42)
+    start = datetime.datetime(2024, 1, 1)
+    occupations = ['Tech-support', 'Craft-repair', 'Sales', 'Exec-managerial', 'Prof-specialty']
+    columns = ('user_id, age, workclass, education, marital_status, occupation, relationship, '
+               'race, gender, hours_per_week, native_country, predicted_salary, '
+               'prediction_confidence, created_at')
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for batch_start in range(0, rows, 50000):
+            batch = []
+            for _ in range(min(50000, rows - batch_start)):
+                user_id = 1 if rng.random() < 0.1 else rng.randint(2, users)
+                created_at = start + datetime.timedelta(seconds=rng.randint(0, 365 * 86400))
+                batch.append((user_id, rng.randint(17, 90), 'Private', 'Bachelors',
+                              'Never-married', rng.choice(occupations), 'Not-in-family',
+                              'White', 'Male', rng.randint(1, 99),
+                              'United-States', rng.choice(['<=50K', '>50K']), rng.random(),
+                              created_at.strftime('%Y-%m-%d %H:%M:%S.%f')))
+            cursor.executemany(f"INSERT INTO prediction ({columns}) "
+                               f"VALUES ({', '.join('?' * 14)})", batch)
+            connection.commit()
+        cursor.execute('ANALYZE')
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def legacy_dashboard_stats(user_id):
+    """The original dashboard: recent list plus two separate count queries"""
+    from models import Prediction
+    recent_predictions = Prediction.query.filter_by(user_id=user_id)\
+                                        .order_by(Prediction.created_at.desc())\
+                                        .limit(10).all()
+    total_predictions = Prediction.query.filter_by(user_id=user_id).count()
+    high_salary_predictions = Prediction.query.filter_by(user_id=user_id,
+                                                         predicted_salary='>50K').count()
+    return recent_predictions, total_predictions, high_salary_predictions
+
+
+def bench_dashboard(args):
+    """Dashboard queries on a seeded SQLite table, with and without the indexes"""
+    app, db = benchmark_app(args.rows)
+    from models import Prediction
+    from routes import dashboard_stats
+    results = {'rows': args.rows, 'mismatches': 0}
+    with app.app_context():
+        def run(stats):
+            recent, total, high = stats(1)
+            db.session.expunge_all()
+            return [p.id for p in recent], total, high
+
+        indexes = list(Prediction.__table__.indexes)
+        for index in indexes:
+            index.drop(db.engine)
+        expected, results['legacy_no_index_ms'] = timed(lambda: run(legacy_dashboard_stats), 5)
+        for index in indexes:
+            index.create(db.engine)
+        db.session.execute(db.text('ANALYZE'))
+        _, results['legacy_indexed_ms'] = timed(lambda: run(legacy_dashboard_stats), 20)
+        actual, results['aggregate_indexed_ms'] = timed(lambda: run(dashboard_stats), 20)
+        results['mismatches'] = int(actual != expected)
+    for key in ('legacy_no_index_ms', 'legacy_indexed_ms', 'aggregate_indexed_ms'):
+        results[key] *= 1000
+    results['speedup'] = results['legacy_no_index_ms'] / results['aggregate_indexed_ms']
+    return results
+
+
+def bench_history(args):
+    """First and deep history pages for the heaviest user, keyset cursor vs OFFSET"""
+    app, db = benchmark_app(args.rows)
+    from models import Prediction
+    from routes import HISTORY_PAGE_SIZE, encode_cursor, history_page
+    results = {'rows': args.rows, 'mismatches': 0}
+    with app.app_context():
+        ordered = Prediction.query.filter_by(user_id=1)\
+                                  .order_by(Prediction.created_at.desc(), Prediction.id.desc())
+        last_page = max(1, -(-ordered.count() // HISTORY_PAGE_SIZE))
+        results['deep_page'] = deep_page = min(args.page, last_page)
+
+        def offset_page(page):
+            rows = ordered.offset((page - 1) * HISTORY_PAGE_SIZE).limit(HISTORY_PAGE_SIZE).all()
+            db.session.expunge_all()
+            return [p.id for p in rows]
+
+        def keyset_page(cursor):
+            rows, _ = history_page(1, cursor)
+            db.session.expunge_all()
+            return [p.id for p in rows]
+
+        # The cursor a client holds after paging to deep_page - 1
+        deep_cursor = None
+        if deep_page > 1:
+            previous = ordered.offset((deep_page - 1) * HISTORY_PAGE_SIZE - 1).first()
+            deep_cursor = encode_cursor(previous)
+            db.session.expunge_all()
+
+        for label, page, cursor in (('first', 1, None), ('deep', deep_page, deep_cursor)):
+            expected, results[f'{label}_offset_ms'] = timed(lambda: offset_page(page), 20)
+            actual, results[f'{label}_keyset_ms'] = timed(lambda: keyset_page(cursor), 20)
+            results['mismatches'] += int(actual != expected)
+    for key in ('first_offset_ms', 'first_keyset_ms', 'deep_offset_ms', 'deep_keyset_ms'):
+        results[key] *= 1000
+    results['deep_speedup'] = results['deep_offset_ms'] / results['deep_keyset_ms']
+    return results
+
+
+SYNTHETIC_CHOICES = {
+    'workclass': ['Private', 'Self-emp-not-inc', 'Self-emp-inc', 'Federal-gov', 'Local-gov',
+                  'State-gov', 'Without-pay'],
+    'education': ['Bachelors', 'Some-college', '11th', 'HS-grad', 'Prof-school', 'Assoc-acdm',
+                  'Assoc-voc', '9th', '7th-8th', '12th', 'Masters', '1st-4th', '10th',
+                  'Doctorate', '5th-6th', 'Preschool'],
+    'marital-status': ['Married-civ-spouse', 'Divorced', 'Never-married', 'Separated',
+                       'Widowed', 'Married-spouse-absent', 'Married-AF-spouse'],
+    'occupation': ['Tech-support', 'Craft-repair', 'Other-service', 'Sales', 'Exec-managerial',
+                   'Prof-specialty', 'Handlers-cleaners', 'Machine-op-inspct', 'Adm-clerical',
+                   'Farming-fishing', 'Transport-moving', 'Priv-house-serv', 'Protective-serv',
+                   'Armed-Forces'],
+    'relationship': ['Wife', 'Own-child', 'Husband', 'Not-in-family', 'Other-relative',
+                     'Unmarried'],
+    'race': ['White', 'Asian-Pac-Islander', 'Amer-Indian-Eskimo', 'Other', 'Black'],
+    'gender': ['Female', 'Male'],
+    'native-country': ['United-States', 'Mexico', 'Philippines', 'Germany', 'Canada', 'India',
+                       'England', 'China', 'Cuba', 'Jamaica'],
+}
+
+
+def write_synthetic_dataset(path, rows, seed=42):
+    """Write a seeded dataset with the columns and categories of employee_data.csv.
+
+    Categories are the ones the prediction form offers, so every synthetic
+    record is also a valid form submission. Income follows a noisy score
+    of age, hours, education and marital status so the forest has
+    something to learn.
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'age': rng.integers(17, 91, rows)})
+    df['workclass'] = rng.choice(SYNTHETIC_CHOICES['workclass'], rows)
+    df['fnlwgt'] = rng.integers(10000, 1000000, rows)
+    df['education'] = rng.choice(SYNTHETIC_CHOICES['education'], rows)
+    df['educational-num'] = rng.integers(1, 17, rows)
+    for column in ('marital-status', 'occupation', 'relationship', 'race', 'gender'):
+        df[column] = rng.choice(SYNTHETIC_CHOICES[column], rows)
+    df['capital-gain'] = np.where(rng.random(rows) < 0.05, rng.integers(0, 20000, rows), 0)
+    df['capital-loss'] = 0
+    df['hours-per-week'] = rng.integers(1, 100, rows)
+    df['native-country'] = rng.choice(SYNTHETIC_CHOICES['native-country'], rows)
+    score = ((df['age'].clip(upper=60) - 17) / 43 + df['hours-per-week'] / 60
+             + df['education'].isin(['Bachelors', 'Masters', 'Doctorate', 'Prof-school'])
+             + (df['marital-status'] == 'Married-civ-spouse')
+             + rng.normal(0, 0.5, rows))
+    df['income'] = np.where(score > 2.2, '>50K', '<=50K')
+    df.to_csv(path, index=False)
+
+
+def prepare_synthetic_workspace(rows):
+    """Train a model on a synthetic dataset in a temporary directory and move there"""
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    if package_dir not in sys.path:
+        sys.path.insert(0, package_dir)
+    tmp = tempfile.mkdtemp(prefix='salary-workspace-')
+    atexit.register(shutil.rmtree, tmp, ignore_errors=True)
+    os.makedirs(os.path.join(tmp, 'data'))
+    write_synthetic_dataset(os.path.join(tmp, 'data', 'employee_data.csv'), rows)
+    os.chdir(tmp)
+    from ml_model import MLModel
+    start = time.perf_counter()
+    MLModel().train_model()
+    return time.perf_counter() - start
+
+
+def environment_info():
+    """Library versions, hardware and git commit recorded alongside the results"""
+    from importlib.metadata import version
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=package_dir, check=True,
+                                capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        **{package: version(package)
+           for package in ('numpy', 'pandas', 'scikit-learn', 'flask', 'sqlalchemy')},
+        'git_commit': commit,
+    }
+
+
+def latency_summary(prefix, durations):
+    """Mean, median and p95 in milliseconds for a list of per-call seconds"""
+    durations = np.asarray(durations) * 1000
+    return {
+        f'{prefix}_mean_ms': float(durations.mean()),
+        f'{prefix}_p50_ms': float(np.percentile(durations, 50)),
+        f'{prefix}_p95_ms': float(np.percentile(durations, 95)),
+    }
+
+
+def bench_preprocess(args):
+    """MLModel.preprocess_data on frames of 1, 100 and 10,000 records"""
+    ml_model = load_ml_model()
+    records = load_records(ml_model)
+    rng = np.random.default_rng(42)
+    results = {}
+    for batch_size in (1, 100, 10000):
+        df = pd.DataFrame([records[i] for i in rng.integers(0, len(records), batch_size)])
+        repeat = max(3, 1000 // batch_size)
+        _, elapsed = timed(lambda: ml_model.preprocess_data(df, is_training=False), repeat)
+        results[f'batch_{batch_size}_ms'] = elapsed * 1000
+        results[f'batch_{batch_size}_rows_per_second'] = batch_size / elapsed
+    return results
+
+
+def bench_predict(args):
+    """MLModel.predict for one record and predict_batch for 100 and 10,000 records"""
+    ml_model = load_ml_model()
+    records = load_records(ml_model)
+    rng = np.random.default_rng(42)
+    sample = [records[i] for i in rng.integers(0, len(records), args.sample)]
+    durations = []
+    for record in sample:
+        start = time.perf_counter()
+        ml_model.predict(record)
+        durations.append(time.perf_counter() - start)
+    results = latency_summary('batch_1', durations)
+    results['batch_1_rows_per_second'] = len(sample) / sum(durations)
+    for batch_size in (100, 10000):
+        batch = [records[i] for i in rng.integers(0, len(records), batch_size)]
+        repeat = max(3, 1000 // batch_size)
+        _, elapsed = timed(lambda: ml_model.predict_batch(batch), repeat)
+        results[f'batch_{batch_size}_ms'] = elapsed * 1000
+        results[f'batch_{batch_size}_rows_per_second'] = batch_size / elapsed
+    return results
+
+
+def bench_model_load(args):
+    """Time to construct a loaded MLModel in each backend and load mode"""
+    from ml_model import MLModel
+    ml_model = load_ml_model()
+    # Compile the forest files once so the mmap timing only maps them
+    MLModel(backend='compiled', load_mode='mmap')
+    results = {}
+    for backend, load_mode in (('sklearn', 'memory'), ('compiled', 'memory'),
+                               ('compiled', 'mmap')):
+        _, elapsed = timed(lambda: MLModel(backend=backend, load_mode=load_mode), args.repeat)
+        results[f'{backend}_{load_mode}_seconds'] = elapsed
+    for path in (ml_model.model_path, ml_model.encoders_path):
+        results[f'{os.path.basename(path)}_mb'] = os.path.getsize(path) / 2**20
+    return results
+
+
+def bench_routes(args):
+    """POST /predict and GET /dashboard through the Flask test client"""
+    app, db = benchmark_app(args.rows)
+    from model_registry import get_model
+    from models import Prediction
+    from routes import FORM_TO_FEATURE
+    records = load_records(get_model())
+    rng = np.random.default_rng(42)
+    app.config['WTF_CSRF_ENABLED'] = False
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+
+    forms = [{field: records[i][feature] for field, feature in FORM_TO_FEATURE.items()}
+             for i in rng.integers(0, len(records), args.sample)]
+
+    def saved_predictions():
+        with app.app_context():
+            return db.session.query(Prediction).filter_by(user_id=1).count()
+
+    results = {'rows': args.rows, 'mismatches': 0}
+    saved_before = saved_predictions()
+    for name, call in (('predict', lambda form: client.post('/predict', data=form)),
+                       ('dashboard', lambda form: client.get('/dashboard'))):
+        # One untimed request warms the model, templates and connection pool
+        call(forms[0])
+        durations = []
+        for form in forms:
+            start = time.perf_counter()
+            response = call(form)
+            durations.append(time.perf_counter() - start)
+            results['mismatches'] += int(response.status_code != 200)
+        results.update(latency_summary(name, durations))
+    # A form that failed validation still renders with 200, so also check
+    # that every submitted form stored its prediction
+    if not app.config.get('PREDICTION_WRITE_BEHIND'):
+        results['mismatches'] += abs(saved_predictions() - saved_before - len(forms) - 1)
+    return results
+
+
+def run_concurrent(predict, records, concurrency):
+    """Call predict on every record from `concurrency` threads.
+
+    Returns the results in record order, the per-call latencies and the
+    wall time of the whole run.
+    """
+    results = [None] * len(records)
+    durations = [None] * len(records)
+    barrier = threading.Barrier(concurrency + 1)
+
+    def worker(offset):
+        barrier.wait()
+        for i in range(offset, len(records), concurrency):
+            start = time.perf_counter()
+            results[i] = predict(records[i])
+            durations[i] = time.perf_counter() - start
+
+    threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return results, durations, time.perf_counter() - start
+
+
+def bench_micro_batch(args):
+    """Concurrent single-record predictions, one forest call each vs micro-batched"""
+    from micro_batch import MicroBatcher
+    ml_model = load_ml_model()
+    records = load_records(ml_model)
+    rng = np.random.default_rng(42)
+    sample = [records[i] for i in rng.integers(0, len(records), args.sample)]
+    batcher = MicroBatcher().start()
+    expected = [ml_model.predict(record) for record in sample]
+    results = {'mismatches': 0}
+    for concurrency in (1, 4, 16, 64):
+        for mode, predict in (('direct', ml_model.predict),
+                              ('batched', lambda record: batcher.predict(ml_model, record))):
+            actual, durations, elapsed = run_concurrent(predict, sample, concurrency)
+            results['mismatches'] += sum(1 for a, b in zip(actual, expected) if a != b)
+            results[f'c{concurrency}_{mode}_per_second'] = len(sample) / elapsed
+            results[f'c{concurrency}_{mode}_p99_ms'] = float(np.percentile(durations, 99)) * 1000
+        results[f'c{concurrency}_speedup'] = (results[f'c{concurrency}_batched_per_second']
+                                             / results[f'c{concurrency}_direct_per_second'])
+    return results
+
+
+def bench_user_cache(args):
+    """GET /dashboard requests per second with and without the user cache"""
+    app, db = benchmark_app(args.rows)
+    from sqlalchemy import event
+    from models import User
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda *event_args: statements.append(1)
+    event.listen(engine, 'before_cursor_execute', listener)
+    results = {'rows': args.rows, 'mismatches': 0}
+    configured_ttl = app.config['USER_CACHE_TTL']
+    try:
+        for label, ttl in (('uncached', 0), ('cached', 60)):
+            app.config['USER_CACHE_TTL'] = ttl
+            client.get('/dashboard')
+            del statements[:]
+            start = time.perf_counter()
+            for _ in range(args.sample):
+                results['mismatches'] += int(client.get('/dashboard').status_code != 200)
+            elapsed = time.perf_counter() - start
+            results[f'{label}_requests_per_second'] = args.sample / elapsed
+            results[f'{label}_queries_per_request'] = len(statements) / args.sample
+
+        # A change made through the ORM is visible on the next request
+        with app.app_context():
+            user = db.session.get(User, 1)
+            original = user.username
+            user.username = 'renamed'
+            db.session.commit()
+            with app.test_request_context():
+                from app import load_user
+                results['mismatches'] += int(load_user('1').username != 'renamed')
+            user.username = original
+            db.session.commit()
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+        app.config['USER_CACHE_TTL'] = configured_ttl
+    results['speedup'] = (results['cached_requests_per_second']
+                          / results['uncached_requests_per_second'])
+    return results
+
+
+def bench_query_budget(args):
+    """SQL statements per request on every page, checked against routes.QUERY_BUDGETS"""
+    app, db = benchmark_app()
+    from metrics import DB_QUERIES_PER_REQUEST
+    from query_stats import QueryBudgetExceeded
+    from routes import FORM_TO_FEATURE, QUERY_BUDGETS
+    form = {field: SAMPLE_RECORD[feature] for field, feature in FORM_TO_FEATURE.items()}
+    account = {'username': 'budgetuser', 'email': 'budget@example.com',
+               'password': 'benchmark', 'password2': 'benchmark'}
+    requests = [
+        ('index', 'get', '/', {}),
+        ('register', 'post', '/register', {'data': account}),
+        ('login', 'post', '/login', {'data': {'username': 'budgetuser', 'password': 'benchmark'}}),
+        ('predict', 'post', '/predict', {'data': form}),
+        ('predict_batch', 'post', '/api/predict/batch', {'json': [form] * 10}),
+        ('predict_sweep', 'post', '/api/predict/sweep',
+         {'json': {'profile': form, 'vary': [{'feature': 'age', 'start': 17, 'stop': 90}]}}),
+        ('dashboard', 'get', '/dashboard', {}),
+        ('history', 'get', '/history', {}),
+        ('predictions_api', 'get', '/api/predictions', {}),
+        ('export_predictions', 'get', '/predictions/export', {}),
+        ('metrics', 'get', '/metrics', {}),
+        ('prediction_cache_stats', 'get', '/api/model/cache', {}),
+        ('write_behind_stats', 'get', '/api/write-behind', {}),
+        ('logout', 'get', '/logout', {}),
+    ]
+
+    overrides = {'USER_CACHE_TTL': 0, 'QUERY_BUDGET_ENFORCE': True,
+                 'WTF_CSRF_ENABLED': False, 'TESTING': True}
+    configured = {key: app.config[key] for key in overrides if key in app.config}
+    # The user cache off is the worst case; TESTING lets QueryBudgetExceeded reach us
+    app.config.update(overrides)
+    results = {'mismatches': 0}
+    client = app.test_client()
+    try:
+        for endpoint, method, path, kwargs in requests:
+            counted = DB_QUERIES_PER_REQUEST.sample(endpoint)[1]
+            try:
+                response = getattr(client, method)(path, **kwargs)
+                response.close()
+                results['mismatches'] += int(response.status_code >= 400)
+            except QueryBudgetExceeded as e:
+                print(f"✗ {e}")
+                results['mismatches'] += 1
+            # As counted for the budget, so a streamed body's query is not included
+            results[f'{endpoint}_queries'] = int(DB_QUERIES_PER_REQUEST.sample(endpoint)[1] - counted)
+            results[f'{endpoint}_budget'] = QUERY_BUDGETS[endpoint]
+    finally:
+        for key in overrides:
+            app.config.pop(key, None)
+        app.config.update(configured)
+    return results
+
+
+def bench_sweep(args):
+    """An age x hours-per-week sweep: one grid evaluation vs batch and per-record predictions"""
+    ml_model = load_ml_model()
+    ml_model.cache.max_size = 0
+    ages, hours = list(range(17, 91)), list(range(1, 100))
+    grid = [dict(SAMPLE_RECORD, **{'age': age, 'hours-per-week': hour})
+            for age in ages for hour in hours]
+
+    (probabilities, classes), sweep_time = timed(
+        lambda: ml_model.sweep(SAMPLE_RECORD, [('age', ages), ('hours-per-week', hours)]), 3)
+    surface = probabilities.reshape(len(grid), -1)
+    expected, batch_time = timed(lambda: ml_model.predict_batch(grid))
+    step = max(1, len(grid) // args.sample)
+    sample = grid[::step]
+    per_record, record_time = timed(lambda: [ml_model.predict(record) for record in sample])
+
+    labels = classes[surface.argmax(axis=1)]
+    mismatches = sum(1 for (label, confidence), row, predicted in zip(expected, surface, labels)
+                     if label != predicted or confidence != row.max())
+    mismatches += sum(1 for result, index in zip(per_record, range(0, len(grid), step))
+                      if result != (labels[index], float(surface[index].max())))
+    per_record_estimate = record_time / len(sample) * len(grid)
+    return {
+        'grid_points': len(grid),
+        'mismatches': mismatches,
+        'sweep_ms': sweep_time * 1000,
+        'predict_batch_ms': batch_time * 1000,
+        'per_record_estimate_ms': per_record_estimate * 1000,
+        'speedup_vs_per_record': per_record_estimate / sweep_time,
+    }
+
+
+def bench_bulk_score(args):
+    """Offline CSV scoring rows per second with one process and with --workers processes"""
+    from bulk_scoring import score_csv
+    results = {'mismatches': 0}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'employee_data.csv')
+        write_scaled_dataset('data/employee_data.csv', path, args.scale)
+        outputs = []
+        for processes in (1, args.workers):
+            output = os.path.join(tmp, f'scored_{processes}.csv')
+            summary = score_csv(path, output, processes=processes)
+            results['rows'] = summary['rows']
+            results[f'processes_{processes}_rows_per_second'] = summary['rows_per_second']
+            outputs.append(output)
+        results['mismatches'] = int(not filecmp.cmp(*outputs, shallow=False))
+    results['speedup'] = (results[f'processes_{args.workers}_rows_per_second']
+                          / results['processes_1_rows_per_second'])
+    return results
+
+
+def bench_early_exit(args):
+    """Early-exit voting on the held-out split: trees used, speedup and label disagreement"""
+    from forest_engine import CompiledForest
+    ml_model = load_ml_model()
+    compiled = CompiledForest.from_sklearn(ml_model.model)
+    X, y = ml_model.prepare_training_data()
+    _, X_test, _, _ = ml_model.split_data(X, y)
+    X_test = np.asarray(X_test, dtype=np.float32)
+    sample = X_test[:args.sample]
+
+    expected, full_time = timed(lambda: compiled.predict_proba(X_test), 3)
+    expected_labels = expected.argmax(axis=1)
+    _, full_record_time = timed(lambda: [compiled.predict_proba(row[np.newaxis]) for row in sample])
+
+    results = {'held_out_rows': len(X_test), 'trees': compiled.n_estimators, 'mismatches': 0}
+    for tolerance in (0.0, 0.001, 0.01, 0.05):
+        (proba, trees_used), batch_time = timed(
+            lambda: compiled.predict_proba_adaptive(X_test, tolerance), 3)
+        _, record_time = timed(
+            lambda: [compiled.predict_proba_adaptive(row[np.newaxis], tolerance) for row in sample])
+        disagreements = int((proba.argmax(axis=1) != expected_labels).sum())
+        if tolerance == 0:
+            # The strict bound must never change a label
+            results['mismatches'] = disagreements
+        prefix = f'tolerance_{tolerance:g}'
+        results[f'{prefix}_mean_trees'] = float(trees_used.mean())
+        results[f'{prefix}_disagreement_rate'] = disagreements / len(X_test)
+        results[f'{prefix}_batch_speedup'] = full_time / batch_time
+        results[f'{prefix}_per_record_speedup'] = full_record_time / record_time
+    return results
+
+
+BENCHMARKS = {
+    'fast-path': bench_fast_path,
+    'forest': bench_forest,
+    'workers': bench_workers,
+    'startup': bench_startup,
+    'ingest': bench_ingest,
+    'training-matrix': bench_training_matrix,
+    'dashboard': bench_dashboard,
+    'history': bench_history,
+    'preprocess': bench_preprocess,
+    'predict': bench_predict,
+    'model-load': bench_model_load,
+    'routes': bench_routes,
+    'micro-batch': bench_micro_batch,
+    'user-cache': bench_user_cache,
+    'query-budget': bench_query_budget,
+    'sweep': bench_sweep,
+    'bulk-score': bench_bulk_score,
+    'early-exit': bench_early_exit,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument('--sample', type=int, default=500,
+                        help='records used for per-call timings (default: 500)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='worker processes for the memory benchmark (default: 4)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='fresh processes per startup measurement (default: 3)')
+    parser.add_argument('--scale', type=int, default=100,
+                        help='copies of the dataset used by the ingest benchmark (default: 100)')
+    parser.add_argument('--rows', type=int, default=1000000,
+                        help='predictions seeded into the SQLite benchmark database (default: 1000000)')
+    parser.add_argument('--page', type=int, default=10000,
+                        help='deep history page compared with page 1 (default: 10000)')
+    parser.add_argument('--limit', type=int, default=None,
+                        help='only check the first N training records (default: all)')
+    parser.add_argument('--synthetic', type=int, default=None, metavar='ROWS',
+                        help='train on a seeded synthetic dataset of ROWS records in a '
+                             'temporary directory instead of the working directory')
+    parser.add_argument('--json', metavar='PATH', default=None,
+                        help='also write the results and environment as JSON to PATH')
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)}")
+
+    logging.disable(logging.INFO)
+
+    print("Employee Salary Prediction - Benchmarks")
+    print("=" * 55)
+
+    report = {'environment': environment_info(), 'arguments': vars(args), 'results': {}}
+    if args.json:
+        args.json = os.path.abspath(args.json)
+    if args.synthetic:
+        print(f"\nTraining on {args.synthetic} synthetic records")
+        report['synthetic_training_seconds'] = prepare_synthetic_workspace(args.synthetic)
+
+    failed = False
+    for name in args.benchmarks or list(BENCHMARKS):
+        print(f"\n{name}")
+        results = BENCHMARKS[name](args)
+        report['results'][name] = results
+        for key, value in results.items():
+            if isinstance(value, float):
+                value = f"{value:.4f}"
+            print(f"  {key}: {value}")
+        if results.get('mismatches'):
+            print(f"✗ {name}: results differ from the reference path")
+            failed = True
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from ml_model import MLModel
+
+# The model in each scoring worker process, set once per process
+_model = None
+
+
+def _init_worker(early_exit_tolerance):
+    global _model
+    logging.disable(logging.INFO)
+    # Every worker maps the same compiled forest files, so the pool shares
+    # one physical copy of the model through the page cache
+    _model = MLModel(backend='compiled', load_mode='mmap')
+    _model.set_early_exit(early_exit_tolerance)
+
+
+def _score_chunk(chunk):
+    """Predictions and confidences for one chunk of input rows, in row order.
+
+    Rows whose numeric features are missing or not numbers get an empty
+    prediction and a NaN confidence.
+    """
+    features = chunk.rename(columns=str.strip)[_model.feature_columns].copy()
+    for column in features.columns:
+        values = features[column].str.strip()
+        if column in _model.NUMERIC_COLUMNS:
+            features[column] = pd.to_numeric(values, errors='coerce')
+        else:
+            # '?' and empty fields are missing, like in the training data
+            features[column] = values.replace({'?': np.nan, '': np.nan})
+    valid = features[list(_model.NUMERIC_COLUMNS)].notna().all(axis=1).to_numpy()
+
+    predictions = np.full(len(chunk), '', dtype=object)
+    confidences = np.full(len(chunk), np.nan)
+    if valid.any():
+        X_processed = _model.preprocess_data(features[valid], is_training=False)
+        predictions[valid], confidences[valid] = _model.predict_encoded(X_processed)
+    return predictions, confidences
+
+
+def read_chunks(path, chunksize):
+    """Stream the input CSV as DataFrames of at most chunksize rows.
+
+    Every field is read as the original text, so the output repeats the
+    input rows exactly; the workers parse the features.
+    """
+    return pd.read_csv(path, chunksize=chunksize, dtype=str, keep_default_na=False)
+
+
+def score_csv(input_path, output_path, chunksize=50000, processes=None, early_exit_tolerance=None):
+    """Score every row of input_path and write it with its prediction to output_path.
+
+    Chunks are scored in parallel worker processes. At most two chunks per
+    worker are in flight, and results are written as soon as the oldest
+    one is done. So output rows stay in input order, and memory is bounded
+    by the chunk size rather than the file size. early_exit_tolerance
+    turns on early-exit voting (see MLModel.set_early_exit). Returns a
+    summary dict.
+    """
+    # Compile the forest files once so the workers only map them
+    ml_model = MLModel(backend='compiled', load_mode='mmap')
+    if ml_model.get_estimator() is None:
+        raise ValueError("No trained model found; run `flask --app main train-model` first")
+    header = pd.read_csv(input_path, nrows=0).columns.str.strip()
+    missing = [column for column in ml_model.feature_columns if column not in header]
+    if missing:
+        raise ValueError(f"Input is missing columns: {', '.join(missing)}")
+
+    processes = processes or os.cpu_count()
+    rows = skipped = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                             initargs=(early_exit_tolerance,)) as pool, \
+            open(output_path, 'w', newline='') as output:
+        pending = deque()
+
+        def write_oldest():
+            nonlocal rows, skipped
+            chunk, future = pending.popleft()
+            predictions, confidences = future.result()
+            chunk['predicted_salary'] = predictions
+            chunk['prediction_confidence'] = confidences
+            # 17 significant digits so confidences read back exactly
+            chunk.to_csv(output, header=rows == 0, index=False, float_format='%.17g')
+            rows += len(chunk)
+            skipped += int(np.isnan(confidences).sum())
+
+        for chunk in read_chunks(input_path, chunksize):
+            pending.append((chunk, pool.submit(_score_chunk, chunk)))
+            if len(pending) >= 2 * processes:
+                write_oldest()
+        while pending:
+            write_oldest()
+
+    elapsed = time.perf_counter() - start
+    logging.info(f"Scored {rows} rows in {elapsed:.1f}s with {processes} processes")
+    return {
+        'rows': rows,
+        'skipped': skipped,
+        'seconds': elapsed,
+        'rows_per_second': rows / elapsed if elapsed else 0.0,
+        'processes': processes,
+        'model_version': ml_model.model_version,
+    }
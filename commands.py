@@ -0,0 +1,155 @@
+import time
+
+import click
+from app import app, db
+from model_registry import get_model
+from models import Prediction
+
+
+@app.cli.command('init-db')
+def init_db():
+    """Create the database tables and any missing columns and indexes."""
+    db.create_all()
+    # create_all skips tables that already exist, including their new
+    # columns and indexes; new columns are all nullable
+    table = Prediction.__table__
+    existing = {column['name'] for column in db.inspect(db.engine).get_columns(table.name)}
+    with db.engine.begin() as connection:
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                connection.execute(db.text(f'ALTER TABLE {table.name} '
+                                           f'ADD COLUMN {column.name} {column_type}'))
+    for index in table.indexes:
+        index.create(db.engine, checkfirst=True)
+    click.echo('Database tables, columns and indexes created.')
+
+
+@app.cli.command('train-model')
+@click.option('--force', is_flag=True, help='Retrain even if a trained model exists.')
+@click.option('--search', is_flag=True,
+              help='Cross-validate a grid of forest settings and promote the best one.')
+@click.option('--cv', default=3, show_default=True, help='Cross-validation folds for --search.')
+@click.option('--processes', type=int, default=None,
+              help='Worker processes for --search (default: all cores).')
+def train_model(force, search, cv, processes):
+    """Train the salary model and publish it with its label encoders."""
+    ml_model = get_model()
+    params = None
+    if search:
+        from training import search_hyperparameters
+        start = time.perf_counter()
+        results = search_hyperparameters(ml_model, cv=cv, processes=processes)
+        if not results:
+            raise click.ClickException('Hyperparameter search failed; see the log for details.')
+        click.echo(f'Evaluated {len(results)} configurations in {time.perf_counter() - start:.1f}s')
+        for result in results:
+            click.echo(f"  accuracy {result['accuracy']:.4f}  "
+                       f"wall {result['wall_seconds']:6.1f}s  "
+                       f"size {result['model_bytes'] / 2**20:7.1f} MB  {result['params']}")
+        params = results[0]['params']
+        click.echo(f'Promoting {params}')
+        force = True
+
+    start = time.perf_counter()
+    accuracy = ml_model.train_model(force=force, params=params)
+    if accuracy is not None:
+        click.echo(f'Trained in {time.perf_counter() - start:.1f}s, held-out accuracy {accuracy:.4f}')
+    ml_model.load_model()
+    if ml_model.get_estimator() is None:
+        raise click.ClickException('Model training failed; see the log for details.')
+    click.echo(f'Model ready (version {ml_model.model_version}).')
+
+
+@app.cli.command('update-model')
+@click.argument('csv_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--trees', default=50, show_default=True, help='New trees to fit on the batch.')
+@click.option('--max-trees', type=int, default=None,
+              help='Forest size to keep; the oldest trees beyond it are retired '
+                   '(default: the current size).')
+def update_model(csv_path, trees, max_trees):
+    """Add trees fitted on a newly labelled CSV batch without a full retrain."""
+    ml_model = get_model()
+    start = time.perf_counter()
+    try:
+        added, retired = ml_model.update_model(csv_path, n_new_trees=trees, max_trees=max_trees)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    ml_model.load_model()
+    click.echo(f'Added {added} trees and retired {retired} in {time.perf_counter() - start:.1f}s '
+               f'(version {ml_model.model_version}).')
+
+
+@app.cli.command('compact-model')
+@click.option('--prune/--no-prune', default=True, show_default=True,
+              help='Collapse splits whose leaves predict the same distribution.')
+def compact_model(prune):
+    """Publish the model with salary_model.npz and compare it with salary_model.joblib."""
+    import os
+    import joblib
+    import numpy as np
+    from forest_engine import CompiledForest
+    ml_model = get_model()
+    try:
+        forest = ml_model.save_compact_model(prune=prune)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    def load_seconds(load):
+        times = []
+        for _ in range(3):
+            start = time.perf_counter()
+            load()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    for label, path, load in (
+            ('joblib', ml_model.model_path, lambda: joblib.load(ml_model.model_path)),
+            ('compact', ml_model.compact_model_path,
+             lambda: CompiledForest.load_compact(ml_model.compact_model_path))):
+        click.echo(f'{label:8} {os.path.getsize(path) / 2**20:8.2f} MB  '
+                   f'load {load_seconds(load) * 1000:7.1f} ms  ({path})')
+    total_nodes = sum(estimator.tree_.node_count for estimator in ml_model.model.estimators_)
+    click.echo(f'Nodes: {total_nodes} -> {len(forest.left)} after pruning' if prune
+               else f'Nodes: {total_nodes}')
+
+    # Agreement on the held-out split the model was evaluated on
+    X, y = ml_model.prepare_training_data()
+    if X is None:
+        click.echo('No training data found; skipped the agreement check.')
+        return
+    _, X_test, _, _ = ml_model.split_data(X, y)
+    compact = CompiledForest.load_compact(ml_model.compact_model_path)
+    expected = ml_model.model.predict_proba(X_test)
+    actual = compact.predict_proba(X_test.to_numpy())
+    identical = int((expected == actual).all(axis=1).sum())
+    same_label = int((expected.argmax(axis=1) == actual.argmax(axis=1)).sum())
+    click.echo(f'Held-out rows: {len(X_test)}, identical probabilities: {identical}, '
+               f'same label: {same_label}, max difference: {np.abs(expected - actual).max():.3g}')
+    if same_label != len(X_test):
+        raise click.ClickException('The compact model disagrees with the original.')
+
+
+@app.cli.command('score-csv')
+@click.argument('input_path', type=click.Path(exists=True, dir_okay=False))
+@click.argument('output_path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--chunksize', default=50000, show_default=True, help='Rows scored per task.')
+@click.option('--processes', type=int, default=None,
+              help='Scoring processes (default: all cores).')
+@click.option('--early-exit-tolerance', type=click.FloatRange(0, 1, max_open=True), default=None,
+              help='Stop evaluating trees once the chance of a label flip is below this '
+                   '(0: only when a flip is impossible; default: evaluate every tree).')
+def score_csv(input_path, output_path, chunksize, processes, early_exit_tolerance):
+    """Score every row of a CSV offline and write it with its prediction."""
+    from bulk_scoring import score_csv as run_scoring
+    try:
+        summary = run_scoring(input_path, output_path, chunksize=chunksize, processes=processes,
+                              early_exit_tolerance=early_exit_tolerance)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Scored {summary['rows']} rows in {summary['seconds']:.1f}s "
+               f"({summary['rows_per_second']:,.0f} rows/s, {summary['processes']} processes, "
+               f"model version {summary['model_version']}).")
+    if summary['skipped']:
+        click.echo(f"{summary['skipped']} rows had a missing or non-numeric age or "
+                   f"hours-per-week and were left unscored.")
@@ -0,0 +1,342 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+
+def _narrowest_uint(values):
+    """values as the smallest unsigned integer dtype that holds them"""
+    high = int(values.max()) if len(values) else 0
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if high <= np.iinfo(dtype).max:
+            return values.astype(dtype)
+    return values.astype(np.uint64)
+
+
+def _prune_tree(children_left, children_right, value):
+    """Collapse splits whose two leaves hold identical class distributions.
+
+    Collapsing runs bottom up, so a whole subtree whose leaves all agree
+    becomes one leaf. Either side of such a split yields the same
+    probabilities, so predictions are unchanged. Returns pruned copies of
+    children_left and value.
+    """
+    children_left = children_left.copy()
+    value = value.copy()
+    levels = [np.array([0])]
+    while levels[-1].size:
+        internal = levels[-1][children_left[levels[-1]] != -1]
+        levels.append(np.concatenate([children_left[internal], children_right[internal]]))
+    for level in reversed(levels[:-1]):
+        internal = level[children_left[level] != -1]
+        left, right = children_left[internal], children_right[internal]
+        collapse = ((children_left[left] == -1) & (children_left[right] == -1)
+                    & (value[left] == value[right]).all(axis=1))
+        value[internal[collapse]] = value[left[collapse]]
+        children_left[internal[collapse]] = -1
+    return children_left, value
+
+
+def _round_down_float32(values):
+    """Round float64 thresholds down to the nearest float32.
+
+    Trees see float32 inputs, so for any float32 x, x <= t holds exactly
+    when x <= the largest float32 not greater than t.
+    """
+    rounded = values.astype(np.float32)
+    too_high = rounded.astype(np.float64) > values
+    rounded[too_high] = np.nextafter(rounded[too_high], np.float32(-np.inf))
+    return rounded
+
+
+class CompiledForest:
+    """A fitted RandomForestClassifier flattened into contiguous NumPy arrays.
+
+    Every tree's nodes live in the same arrays. Nodes are laid out breadth
+    first so that a node's right child always directly follows its left
+    child, and leaves point back to themselves with an infinite threshold.
+    A batch is evaluated by advancing all trees one level at a time for
+    max_depth steps with plain array indexing, instead of dispatching per
+    estimator. Predictions are identical to RandomForestClassifier.predict_proba.
+    """
+
+    def __init__(self, feature, threshold, left, value, roots, max_depth, classes):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.classes_ = classes
+
+    @classmethod
+    def from_sklearn(cls, forest, prune=False):
+        """Compile a fitted RandomForestClassifier, optionally pruning redundant splits"""
+        features, thresholds, lefts, values, roots = [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            children_left, children_right = tree.children_left, tree.children_right
+            # tree_.value already holds the class fractions predict_proba returns
+            tree_value = tree.value[:, 0, :forest.n_classes_]
+            if prune:
+                children_left, tree_value = _prune_tree(children_left, children_right, tree_value)
+
+            # Breadth-first order with siblings stored next to each other
+            level = np.array([0])
+            order = [level]
+            while level.size:
+                internal = level[children_left[level] != -1]
+                level = np.column_stack([children_left[internal],
+                                         children_right[internal]]).ravel()
+                order.append(level)
+            # The last level is empty
+            max_depth = max(max_depth, len(order) - 2)
+            order = np.concatenate(order)
+            # Pruned subtrees are left out of order; their positions go unused
+            position = np.zeros(len(children_left), dtype=order.dtype)
+            position[order] = np.arange(len(order))
+
+            is_leaf = children_left[order] == -1
+            new_ids = np.arange(len(order))
+            features.append(np.where(is_leaf, 0, tree.feature[order]))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold[order]))
+            lefts.append(offset + np.where(is_leaf, new_ids,
+                                           position[np.maximum(children_left[order], 0)]))
+            values.append(tree_value[order])
+
+            roots.append(offset)
+            offset += len(order)
+
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features), dtype=np.int32),
+            threshold=_round_down_float32(np.concatenate(thresholds)),
+            left=np.ascontiguousarray(np.concatenate(lefts), dtype=np.int32),
+            value=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+            classes=forest.classes_,
+        )
+
+    ARRAYS = ('feature', 'threshold', 'left', 'value', 'roots', 'classes_')
+
+    def save(self, path, **metadata):
+        """Write the arrays as .npy files into the new directory path.
+
+        The files are staged in a temporary directory that is renamed to
+        path, so a reader never sees part of a forest. An existing directory
+        is never replaced: if path already exists, another process published
+        the same forest first and the staged copy is discarded.
+        """
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.forest-', dir=parent)
+        try:
+            for name in self.ARRAYS:
+                array = getattr(self, name)
+                if name == 'classes_':
+                    # sklearn keeps string labels in an object array
+                    array = array.astype(str)
+                np.save(os.path.join(staging, f'{name}.npy'), array, allow_pickle=False)
+            with open(os.path.join(staging, 'metadata.json'), 'w') as f:
+                json.dump(dict(metadata, max_depth=int(self.max_depth)), f)
+            try:
+                os.rename(staging, path)
+            except OSError:
+                if not os.path.isdir(path):
+                    raise
+                shutil.rmtree(staging, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+    @staticmethod
+    def read_metadata(path):
+        """Return the metadata saved with a compiled forest, or None if there is none"""
+        try:
+            with open(os.path.join(path, 'metadata.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """Load a forest written by save; mmap_mode='r' maps the arrays read-only.
+
+        Memory-mapped arrays are backed by the page cache, so every process
+        that maps the same files shares one physical copy of the forest.
+        """
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode,
+                                allow_pickle=False)
+                  for name in cls.ARRAYS}
+        metadata = cls.read_metadata(path)
+        return cls(
+            feature=arrays['feature'],
+            threshold=arrays['threshold'],
+            left=arrays['left'],
+            value=arrays['value'],
+            roots=np.array(arrays['roots']),
+            max_depth=metadata['max_depth'],
+            classes=np.array(arrays['classes_']),
+        )
+
+    def save_compact(self, path, **metadata):
+        """Write the forest as one compressed .npz file, replacing path atomically.
+
+        Only what evaluation needs is stored, in the narrowest dtypes: a leaf
+        bitmap, the feature and float32 threshold of each split, and an index
+        into the table of distinct leaf distributions. Child indices are not
+        stored at all, because in the breadth-first layout the left child of
+        a tree's k-th split is always node 2k + 1.
+        """
+        is_leaf = self.left == np.arange(len(self.left))
+        sizes = np.diff(np.append(self.roots, len(self.left)))
+        leaf_values, leaf_value_index = np.unique(self.value[is_leaf], axis=0, return_inverse=True)
+        metadata = dict(metadata, max_depth=int(self.max_depth), n_nodes=len(self.left))
+        arrays = {
+            'tree_sizes': _narrowest_uint(sizes),
+            'is_leaf': np.packbits(is_leaf),
+            'feature': _narrowest_uint(self.feature[~is_leaf]),
+            'threshold': self.threshold[~is_leaf],
+            'leaf_values': leaf_values,
+            'leaf_value_index': _narrowest_uint(leaf_value_index.ravel()),
+            'classes_': self.classes_.astype(str),
+            'metadata': np.array(json.dumps(metadata)),
+        }
+        parent = os.path.dirname(os.path.abspath(path))
+        fd, staging = tempfile.mkstemp(prefix='.forest-', suffix='.npz', dir=parent)
+        os.close(fd)
+        try:
+            np.savez_compressed(staging, **arrays)
+            os.replace(staging, path)
+        except Exception:
+            os.unlink(staging)
+            raise
+
+    @staticmethod
+    def read_compact_metadata(path):
+        """Return the metadata saved in a compact forest file, or None if it is unreadable"""
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                return json.loads(str(data['metadata']))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @classmethod
+    def load_compact(cls, path):
+        """Load a forest written by save_compact"""
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+        metadata = json.loads(str(arrays['metadata']))
+        sizes = arrays['tree_sizes'].astype(np.int64)
+        n_nodes = int(sizes.sum())
+        roots = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        is_leaf = np.unpackbits(arrays['is_leaf'], count=n_nodes).astype(bool)
+        internal = ~is_leaf
+
+        # Left child of a tree's k-th split is node 2k + 1 of that tree
+        tree_of_node = np.repeat(np.arange(len(sizes)), sizes)
+        splits_before_tree = np.concatenate([[0], np.cumsum(np.add.reduceat(internal, roots))[:-1]])
+        split_rank = np.cumsum(internal) - 1 - splits_before_tree[tree_of_node]
+        left = np.where(is_leaf, np.arange(n_nodes), roots[tree_of_node] + 2 * split_rank + 1)
+
+        feature = np.zeros(n_nodes, dtype=np.int32)
+        feature[internal] = arrays['feature']
+        threshold = np.full(n_nodes, np.inf, dtype=np.float32)
+        threshold[internal] = arrays['threshold']
+        value = np.zeros((n_nodes, arrays['leaf_values'].shape[1]))
+        value[is_leaf] = arrays['leaf_values'][arrays['leaf_value_index']]
+        return cls(
+            feature=feature,
+            threshold=threshold,
+            left=left.astype(np.int32),
+            value=value,
+            roots=roots.astype(np.int32),
+            max_depth=metadata['max_depth'],
+            classes=arrays['classes_'].astype(object),
+        )
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    def apply(self, X, roots=None):
+        """Return the leaf index reached in every tree, shape (n_samples, n_trees).
+        
+        roots selects a subset of the trees (default: all of them).
+        """
+        if roots is None:
+            roots = self.roots
+        # Same float32 inputs the sklearn trees see
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_samples, n_features = X.shape
+        flat_X = X.ravel()
+        row_start = (np.arange(n_samples, dtype=np.intp) * n_features)[:, np.newaxis]
+        nodes = np.repeat(roots[np.newaxis, :], n_samples, axis=0)
+        for _ in range(self.max_depth):
+            go_right = (np.take(flat_X, row_start + np.take(self.feature, nodes))
+                        > np.take(self.threshold, nodes))
+            nodes = np.take(self.left, nodes)
+            nodes += go_right
+        return nodes
+
+    def predict_proba(self, X, batch_size=1024):
+        """Average the leaf class distributions over all trees"""
+        X = np.asarray(X, dtype=np.float32)
+        proba = np.empty((X.shape[0], len(self.classes_)))
+        for start in range(0, X.shape[0], batch_size):
+            leaves = self.apply(X[start:start + batch_size])
+            # cumsum adds the trees sequentially, in estimator order, so the
+            # sum rounds exactly like sklearn's per-tree accumulation
+            proba[start:start + batch_size] = self.value[leaves].cumsum(axis=1)[:, -1]
+        proba /= self.n_estimators
+        return proba
+
+    def predict_proba_adaptive(self, X, tolerance=0.0, chunk_size=16):
+        """Class probabilities from as few trees as the vote margin allows.
+        
+        Trees are evaluated chunk_size at a time, and a row stops once its
+        label can no longer change. With tolerance 0 a row stops only when
+        the lead over the runner-up exceeds the number of trees left, so
+        even if every remaining tree voted fully for the runner-up the label
+        could not flip. With tolerance > 0 a row also stops when Hoeffding's
+        inequality bounds the chance of a flip by tolerance, treating the
+        remaining trees as independent votes with no preference between the
+        two leading classes. That is conservative: the trees seen so far
+        favour the leader.
+        
+        Returns the probabilities averaged over the trees each row used,
+        and the number of trees used per row.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        n_trees = self.n_estimators
+        totals = np.zeros((X.shape[0], len(self.classes_)))
+        trees_used = np.zeros(X.shape[0], dtype=np.int64)
+        active = np.arange(X.shape[0])
+        for start in range(0, n_trees, chunk_size):
+            roots = self.roots[start:start + chunk_size]
+            leaves = self.apply(X[active], roots)
+            totals[active] += self.value[leaves].sum(axis=1)
+            used = start + len(roots)
+            trees_used[active] = used
+            remaining = n_trees - used
+            if remaining == 0:
+                break
+            
+            ranked = np.sort(totals[active], axis=1)
+            margin = ranked[:, -1] - ranked[:, -2]
+            # The small slack keeps float rounding in the sums from deciding a near tie
+            done = margin > remaining + 1e-9
+            if tolerance > 0:
+                # Each remaining tree moves the margin by at most 1 either way
+                done |= np.exp(-margin ** 2 / (2 * remaining)) <= tolerance
+            active = active[~done]
+            if not active.size:
+                break
+        return totals / trees_used[:, np.newaxis], trees_used
+    
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
@@ -0,0 +1,10 @@
+# Gunicorn picks this file up automatically from the working directory.
+
+
+def when_ready(server):
+    # Load the ML model once in the master process before any worker is
+    # forked; every worker inherits the loaded model instead of loading its own
+    from model_registry import get_model
+    if get_model().get_estimator() is None:
+        server.log.error("No trained model found; predictions will fail until one exists. "
+                         "Run `flask --app main train-model` and restart.")
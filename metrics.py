@@ -0,0 +1,239 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy.pool import QueuePool
+
+# Latency buckets in seconds, from 50µs (a cached prediction) up to 10s
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_histograms = []
+_gauges = []
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram with label values, in Prometheus style.
+
+    observe() is a bisect and a few additions under a lock, cheap enough to
+    leave on for every request. Each process keeps its own series, so under
+    Gunicorn every worker reports the requests it served.
+    """
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _histograms.append(self)
+
+    def _get_series(self, labelvalues):
+        # Called with the lock held
+        series = self._series.get(labelvalues)
+        if series is None:
+            # Per-bucket counts (the last one is +Inf), then count and sum
+            series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+        return series
+
+    def observe(self, value, *labelvalues):
+        """Record one observation for the series identified by labelvalues"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._get_series(labelvalues)
+            series[0][index] += 1
+            series[1] += 1
+            series[2] += value
+
+    def observe_many(self, values, *labelvalues):
+        """Record every value in an array at once: one bucket count pass and one locked update"""
+        # Imported here so that importing the web app does not pull in NumPy
+        import numpy as np
+        values = np.asarray(values, dtype=np.float64)
+        counts = np.bincount(np.searchsorted(self.buckets, values, side='left'),
+                             minlength=len(self.buckets) + 1).tolist()
+        total = float(values.sum())
+        with self._lock:
+            series = self._get_series(labelvalues)
+            for index, count in enumerate(counts):
+                series[0][index] += count
+            series[1] += len(values)
+            series[2] += total
+
+    def sample(self, *labelvalues):
+        """(count, sum) of the observations for one series so far"""
+        with self._lock:
+            series = self._series.get(labelvalues)
+            return (0, 0.0) if series is None else (series[1], series[2])
+
+    @contextmanager
+    def time(self, *labelvalues):
+        """Observe the wall time of the with block, also when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(labels, list(counts), count, total)
+                      for labels, (counts, count, total) in sorted(self._series.items())]
+        for labelvalues, counts, count, total in series:
+            labels = format_labels(self.labelnames, labelvalues)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                le = format_labels(self.labelnames + ('le',), labelvalues + (str(bound),))
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            lines.append(f'{self.name}_count{labels} {count}')
+            lines.append(f'{self.name}_sum{labels} {total!r}')
+        return lines
+
+
+class Gauge:
+    """Metric whose samples are read from a callback when /metrics is scraped.
+
+    The callback returns a number, a {label value: number} dict for a gauge
+    with one label, or None to leave the gauge out of this scrape. Totals
+    kept elsewhere (such as the cache hit count) use kind='counter'.
+    """
+
+    def __init__(self, name, help, callback, labelname=None, kind='gauge'):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.labelname = labelname
+        self.kind = kind
+        _gauges.append(self)
+
+    def render(self):
+        value = self.callback()
+        if value is None:
+            return []
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        if self.labelname is None:
+            lines.append(f'{self.name} {float(value)!r}')
+        else:
+            for labelvalue, sample in sorted(value.items()):
+                labels = format_labels((self.labelname,), (labelvalue,))
+                lines.append(f'{self.name}{labels} {float(sample)!r}')
+        return lines
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _histograms + _gauges:
+        try:
+            lines.extend(metric.render())
+        except Exception:
+            # A failing callback must not take the whole endpoint down
+            continue
+    return '\n'.join(lines) + '\n'
+
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request, by route',
+    ('endpoint', 'method', 'status'))
+
+PREDICTION_STAGE_SECONDS = Histogram(
+    'prediction_stage_duration_seconds',
+    'Time spent in each stage of a prediction: validate, preprocess, forest, save',
+    ('stage',))
+
+PREDICTION_BATCH_SIZE = Histogram(
+    'prediction_micro_batch_size', 'Records scored together by the micro-batching scheduler',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+
+PREDICTION_TREES_USED = Histogram(
+    'prediction_trees_used', 'Trees evaluated per record when early-exit voting is on',
+    buckets=(16, 32, 48, 64, 96, 128, 160, 200, 300, 500))
+
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a database connection from the pool')
+
+DB_QUERIES_PER_REQUEST = Histogram(
+    'db_queries_per_request', 'SQL statements run while handling a request, by route',
+    ('endpoint',), buckets=(0, 1, 2, 3, 4, 5, 7, 10, 15, 20, 50, 100))
+
+DB_TIME_PER_REQUEST_SECONDS = Histogram(
+    'db_time_per_request_seconds', 'Time spent in SQL statements while handling a request, by route',
+    ('endpoint',))
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each connection checkout waits.
+
+    _do_get covers both waiting for a free pooled connection and opening an
+    overflow connection, which is exactly the wait a request sees.
+    """
+
+    # SQLAlchemy names pool loggers after the class's module; keep this one
+    # under the 'sqlalchemy' logger (WARN unless configured) like QueuePool
+    _sqla_logger_namespace = 'sqlalchemy.pool.impl.QueuePool'
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start)
+
+
+def loaded_model_attribute(read):
+    """Callback reading from the process's model, or None before it is loaded"""
+    def callback():
+        from model_registry import get_loaded_model
+        ml_model = get_loaded_model()
+        return None if ml_model is None else read(ml_model)
+    return callback
+
+
+def pool_status():
+    from app import db
+    pool = db.engine.pool
+    if not isinstance(pool, QueuePool):
+        return None
+    return {'size': pool.size(), 'checked_out': pool.checkedout(), 'overflow': max(pool.overflow(), 0)}
+
+
+Gauge('model_load_duration_seconds', 'Time the last model load took',
+      loaded_model_attribute(lambda ml_model: ml_model.load_seconds))
+Gauge('prediction_cache_entries', 'Predictions held in the LRU cache',
+      loaded_model_attribute(lambda ml_model: ml_model.cache.stats()['size']))
+Gauge('prediction_cache_hits_total', 'Prediction cache hits',
+      loaded_model_attribute(lambda ml_model: ml_model.cache.stats()['hits']), kind='counter')
+Gauge('prediction_cache_misses_total', 'Prediction cache misses',
+      loaded_model_attribute(lambda ml_model: ml_model.cache.stats()['misses']), kind='counter')
+Gauge('prediction_cache_evictions_total', 'Prediction cache evictions',
+      loaded_model_attribute(lambda ml_model: ml_model.cache.stats()['evictions']), kind='counter')
+Gauge('db_pool_connections', 'Database pool connections by state', pool_status, labelname='state')
+
+
+def user_cache_stat(name):
+    def callback():
+        import user_cache
+        cache = user_cache._cache
+        return None if cache is None else cache.stats()[name]
+    return callback
+
+
+Gauge('user_cache_hits_total', 'Logged-in user lookups answered from memory',
+      user_cache_stat('hits'), kind='counter')
+Gauge('user_cache_misses_total', 'Logged-in user lookups that queried the database',
+      user_cache_stat('misses'), kind='counter')
@@ -0,0 +1,105 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import PREDICTION_BATCH_SIZE, PREDICTION_STAGE_SECONDS
+
+_batcher = None
+_lock = threading.Lock()
+
+
+class MicroBatcher:
+    """Scores single-record predictions from concurrent requests in shared forest calls.
+
+    predict() encodes the record and checks the cache in the calling thread,
+    then hands the row to a background thread. That thread takes the first
+    waiting row, keeps collecting for up to window seconds or until
+    max_batch_size rows, and evaluates them with one predict_proba call per
+    model instance. Each caller gets exactly what MLModel.predict would
+    have returned. This only helps when a process serves requests on
+    several threads (for example Gunicorn with --threads); a lone request
+    waits out the window.
+    """
+
+    def __init__(self, window=0.002, max_batch_size=64):
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='micro-batch', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def predict(self, ml_model, input_data):
+        """Same result as ml_model.predict(input_data), scored together with concurrent calls"""
+        if ml_model.get_estimator() is None:
+            raise ValueError("Model not trained or loaded")
+        with PREDICTION_STAGE_SECONDS.time('preprocess'):
+            X_processed = ml_model.encode_record(input_data)
+        cache_key = ml_model.prediction_cache_key(X_processed)
+        cached = ml_model.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        future = Future()
+        self._queue.put((ml_model, X_processed, cache_key, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            PREDICTION_BATCH_SIZE.observe(len(batch))
+            # A model reload can put rows for two instances in one batch
+            by_model = {}
+            for item in batch:
+                by_model.setdefault(id(item[0]), []).append(item)
+            for items in by_model.values():
+                self._score(items)
+
+    def _score(self, items):
+        # Imported here so that importing the web app does not pull in NumPy
+        import numpy as np
+        ml_model = items[0][0]
+        try:
+            predictions, confidences = ml_model.predict_encoded(
+                np.vstack([X_processed for _, X_processed, _, _ in items]))
+        except Exception as e:
+            logging.error(f"Error making batched prediction: {str(e)}")
+            for _, _, _, future in items:
+                future.set_exception(e)
+            return
+        for (_, _, cache_key, future), prediction, confidence in zip(items, predictions, confidences):
+            result = (prediction, float(confidence))
+            ml_model.cache.put(cache_key, result)
+            future.set_result(result)
+
+
+def get_micro_batcher():
+    """Return this process's micro-batcher, or None when micro-batching is disabled.
+
+    Like the write-behind queue, the batcher thread is started on first use
+    so that each forked Gunicorn worker runs its own.
+    """
+    global _batcher
+    from app import app
+    if not app.config.get('PREDICTION_MICRO_BATCH'):
+        return None
+    if _batcher is None:
+        with _lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(
+                    window=app.config.get('PREDICTION_BATCH_WINDOW_MS', 2) / 1000,
+                    max_batch_size=app.config.get('PREDICTION_MAX_BATCH_SIZE', 64),
+                ).start()
+    return _batcher
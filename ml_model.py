@@ -5,37 +5,158 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import accuracy_score, classification_report
 import joblib
+import copy
+import hashlib
+import json
 import os
+import shutil
+import tempfile
 import logging
+import time
+import warnings
+from forest_engine import CompiledForest
+from metrics import PREDICTION_STAGE_SECONDS, PREDICTION_TREES_USED
+from prediction_cache import PredictionCache
+
+def file_digest(*paths, extra=b''):
+    """SHA-256 hex digest of the contents of paths followed by extra bytes"""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    digest.update(extra)
+    return digest.hexdigest()
+
+def predict_proba_array(estimator, X):
+    """estimator.predict_proba on a plain array of encoded rows.
+    
+    The fast paths pass arrays to a forest fitted on a DataFrame, which makes
+    sklearn warn about missing feature names on every call; the warning is
+    silenced for this call only.
+    """
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', message='X does not have valid feature names')
+        return estimator.predict_proba(X)
+
+
+def prune_versions(parent, keep, current=None):
+    """Delete all but the keep most recently written version directories in parent.
+    
+    The directory named current is always kept. Processes that still map
+    files of a deleted version keep reading them; recent versions are kept
+    for workers that are about to load them.
+    """
+    try:
+        versions = [entry for entry in os.scandir(parent)
+                    if entry.is_dir() and not entry.name.startswith('.')]
+    except OSError:
+        return
+    versions.sort(key=lambda entry: (entry.name == current, entry.stat().st_mtime), reverse=True)
+    for entry in versions[keep:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
 
 class MLModel:
-    def __init__(self):
+    # Inference backends: sklearn's own forest, or the flattened array engine
+    BACKENDS = ('sklearn', 'compiled')
+    # 'memory' unpickles the forest into each process; 'mmap' maps the compiled
+    # forest arrays read-only so that every process shares one copy
+    LOAD_MODES = ('memory', 'mmap')
+    
+    # Feature columns read as numbers; every other feature is categorical
+    NUMERIC_COLUMNS = ('age', 'hours-per-week')
+    
+    # Trees evaluated between vote-margin checks when early exit is on
+    EARLY_EXIT_CHUNK_SIZE = 16
+    # Smaller batches evaluate every tree: the compiled forest's cost per
+    # call is mostly fixed overhead, so stopping early only pays off in bulk
+    EARLY_EXIT_MIN_BATCH = 256
+    
+    # Model versions kept in the model store, and compiled forest versions
+    # kept for memory-mapped loading
+    VERSIONS_KEPT = 3
+    
+    # File names inside a model version directory
+    MODEL_FILE = 'salary_model.joblib'
+    ENCODERS_FILE = 'label_encoders.joblib'
+    COMPACT_MODEL_FILE = 'salary_model.npz'
+    
+    def __init__(self, backend='sklearn', cache_size=0, load_mode='memory'):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}")
+        if load_mode not in self.LOAD_MODES:
+            raise ValueError(f"Unknown load mode: {load_mode}")
+        if load_mode == 'mmap' and backend != 'compiled':
+            raise ValueError("The mmap load mode requires the compiled backend")
+        self.backend = backend
+        self.load_mode = load_mode
         self.model = None
+        self.model_version = None
+        self.load_seconds = None
+        # model_files_signature() of the files the loaded model was read from
+        self.loaded_signature = None
+        # Memoized single-record predictions; a cache_size of 0 disables it
+        self.cache = PredictionCache(max_size=cache_size)
+        self.compiled_forest = None
+        # Vote-margin tolerance for early-exit inference; None evaluates every tree
+        self.early_exit_tolerance = None
         self.label_encoders = {}
+        self.category_codes = {}
 
         self.feature_columns = ['age', 'workclass', 'education', 'marital-status', 'occupation', 
                                'relationship', 'race', 'gender', 'hours-per-week', 'native-country']
-        self.model_path = 'salary_model.joblib'
-        self.encoders_path = 'label_encoders.joblib'
+        self.target_column = 'income'
+        self.data_path = 'data/employee_data.csv'
+        # Every saved model is published as models/<version>/, and
+        # models/CURRENT names the version in use
+        self.store_path = 'models'
+        self.forest_path = 'salary_model.forest'
+        self.matrix_cache_path = 'encoded_matrix'
+        self.use_model_dir(self.published_model_dir())
 
         
         # Load existing model if available
         self.load_model()
     
-    def load_data(self):
-        """Load and preprocess the employee salary dataset"""
+    def load_data(self, path=None, chunksize=100000):
+        """Load and preprocess the employee salary dataset.
+        
+        The CSV is streamed in chunks of `chunksize` rows and only the model's
+        columns are read: numbers as float32 (downcast to small ints once
+        cleaned) and text as categoricals, so no chunk ever holds a column of
+        Python strings and peak memory stays close to the size of the result.
+        """
         try:
-            # Load the dataset
-            df = pd.read_csv('data/employee_data.csv')
+            categorical = [col for col in self.feature_columns if col not in self.NUMERIC_COLUMNS]
+            categorical.append(self.target_column)
+            dtypes = {col: 'category' for col in categorical}
+            dtypes.update({col: 'float32' for col in self.NUMERIC_COLUMNS})
             
-            # Clean the data
-            df = df.replace('?', np.nan)
-            df = df.dropna()
+            chunks = []
+            reader = pd.read_csv(path or self.data_path, usecols=list(dtypes), dtype=dtypes,
+                                 na_values=['?'], chunksize=chunksize)
+            for chunk in reader:
+                # Clean the data
+                chunk = chunk.dropna()
+                
+                # Remove leading/trailing spaces from the category labels only
+                for col in categorical:
+                    chunk[col] = self.strip_categories(chunk[col])
+                chunks.append(chunk)
             
-            # Remove leading/trailing spaces
-            for col in df.columns:
-                if df[col].dtype == 'object':
-                    df[col] = df[col].str.strip()
+            # Chunks have their own category sets; give them all the union so
+            # that concat keeps the columns categorical instead of falling back to strings
+            for col in categorical:
+                categories = chunks[0][col].cat.categories
+                for chunk in chunks[1:]:
+                    categories = categories.union(chunk[col].cat.categories)
+                for chunk in chunks:
+                    chunk[col] = chunk[col].cat.set_categories(categories)
+            df = pd.concat(chunks, ignore_index=True)
+            for col in self.NUMERIC_COLUMNS:
+                df[col] = pd.to_numeric(df[col], downcast='integer')
+            df = df[self.feature_columns + [self.target_column]]
             
             logging.info(f"Dataset loaded successfully. Shape: {df.shape}")
             return df
@@ -44,38 +165,67 @@ class MLModel:
             logging.error(f"Error loading data: {str(e)}")
             return None
     
-    def preprocess_data(self, df, is_training=True):
-        """Preprocess the data for training or prediction"""
+    def strip_categories(self, values):
+        """Strip whitespace from the labels of a categorical column"""
+        categories = values.cat.categories
+        stripped = categories.str.strip()
+        if stripped.is_unique:
+            return values.cat.rename_categories(stripped)
+        # Stripping merged some labels; rebuild from the (few) distinct values
+        codes = values.cat.codes.to_numpy()
+        labels = np.asarray(stripped, dtype=object)
+        return pd.Series(pd.Categorical(np.where(codes >= 0, labels[codes], None)),
+                         index=values.index)
+    
+    def encode_column(self, values, codes):
+        """Vectorized category -> code lookup.
+        
+        Missing values are looked up as 'Unknown'; unseen categories get the
+        len(classes_) sentinel.
+        """
+        unknown = codes.get('Unknown', len(codes))
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Look up each distinct category once; code -1 (missing) takes the last entry
+            lookup = np.array([codes.get(category, len(codes))
+                               for category in values.cat.categories] + [unknown], dtype='int64')
+            return pd.Series(lookup[values.cat.codes.to_numpy()], index=values.index)
+        encoded = values.fillna('Unknown').map(codes)
+        return encoded.fillna(len(codes)).astype('int64')
+    
+    def preprocess_data(self, df, is_training=True, category_codes=None):
+        """Preprocess the data for training or prediction.
+        
+        Prediction encodes with category_codes, by default the loaded encoders'.
+        """
+        if category_codes is None:
+            category_codes = self.category_codes
         try:
             # Select features
             X = df[self.feature_columns].copy()
             
             # Encode categorical variables
             for column in X.columns:
-                if X[column].dtype == 'object':
+                is_categorical = isinstance(X[column].dtype, pd.CategoricalDtype)
+                if X[column].dtype == 'object' or is_categorical:
                     if is_training:
                         le = LabelEncoder()
-                        # Handle missing values by replacing with a placeholder
-                        X[column] = X[column].fillna('Unknown')
-                        X[column] = le.fit_transform(X[column])
+                        if is_categorical:
+                            # Fit on the distinct labels instead of every row
+                            categories = list(X[column].cat.remove_unused_categories().cat.categories)
+                            if X[column].isna().any():
+                                # Handle missing values by replacing with a placeholder
+                                categories.append('Unknown')
+                            le.fit(np.asarray(categories, dtype=object))
+                        else:
+                            # Handle missing values by replacing with a placeholder
+                            X[column] = X[column].fillna('Unknown')
+                            le.fit(X[column])
                         self.label_encoders[column] = le
+                        self.category_codes[column] = self.build_category_codes(le)
+                        X[column] = self.encode_column(X[column], self.category_codes[column])
                     else:
-                        if column in self.label_encoders:
-                            # Handle unseen categories and missing values
-                            le = self.label_encoders[column]
-                            X[column] = X[column].fillna('Unknown')
-                            
-                            def encode_value(x):
-                                try:
-                                    if x in le.classes_:
-                                        return le.transform([x])[0]
-                                    else:
-                                        # Return a default value for unseen categories
-                                        return len(le.classes_)
-                                except:
-                                    return len(le.classes_)
-                            
-                            X[column] = X[column].map(encode_value)
+                        if column in category_codes:
+                            X[column] = self.encode_column(X[column], category_codes[column])
                         else:
                             X[column] = 0
             
@@ -86,50 +236,139 @@ class MLModel:
             logging.error(f"Error preprocessing data: {str(e)}")
             return None
     
-    def train_model(self):
-        """Train the machine learning model"""
-        if os.path.exists(self.model_path):
+    def build_category_codes(self, le):
+        """Build the category -> code lookup for a fitted label encoder"""
+        return {category: code for code, category in enumerate(le.classes_)}
+    
+    # Forest settings used unless a training run overrides them
+    DEFAULT_PARAMS = {
+        'n_estimators': 200,
+        'max_depth': 15,
+        'min_samples_split': 10,
+        'min_samples_leaf': 4
+    }
+    
+    @classmethod
+    def build_forest(cls, params=None, n_jobs=None):
+        """Create an unfitted Random Forest with the default settings updated by params"""
+        return RandomForestClassifier(
+            random_state=42,
+            class_weight='balanced',  # Handle class imbalance
+            n_jobs=n_jobs,
+            **dict(cls.DEFAULT_PARAMS, **(params or {}))
+        )
+    
+    def prepare_training_data(self, use_cache=True):
+        """Load the dataset and return the encoded features and the target.
+        
+        The encoded matrix is cached as memory-mapped .npy files next to the
+        encoders, keyed by a hash of the CSV and the feature columns, so later
+        runs skip parsing and encoding until the data or the schema changes.
+        """
+        key = self.training_matrix_key() if use_cache else None
+        if key is not None:
+            cached = self.load_training_matrix(key)
+            if cached is not None:
+                return cached
+        
+        df = self.load_data()
+        if df is None:
+            logging.error("Cannot train model: data loading failed")
+            return None, None
+        
+        logging.info(f"Training data shape: {df.shape}")
+        logging.info(f"Target distribution:\n{df[self.target_column].value_counts()}")
+        
+        # Prepare features and target
+        X = self.preprocess_data(df, is_training=True)
+        if X is None:
+            logging.error("Data preprocessing failed")
+            return None, None
+            
+        y = df[self.target_column].str.strip()
+        
+        logging.info(f"Processed features shape: {X.shape}")
+        logging.info(f"Features: {X.columns.tolist()}")
+        
+        if key is not None:
+            try:
+                self.save_training_matrix(key, X, y)
+            except OSError as e:
+                logging.warning(f"Could not cache the encoded training matrix: {str(e)}")
+        return X, y
+    
+    def training_matrix_key(self):
+        """Cache key of the encoded matrix: the CSV contents plus the column schema"""
+        if not os.path.exists(self.data_path):
+            return None
+        schema = json.dumps([self.feature_columns, self.target_column]).encode()
+        return file_digest(self.data_path, extra=schema)
+    
+    def load_training_matrix(self, key):
+        """Map the cached encoded matrix read-only if it was built for key"""
+        try:
+            with open(os.path.join(self.matrix_cache_path, 'metadata.json')) as f:
+                metadata = json.load(f)
+            if metadata.get('key') != key:
+                return None
+            X = np.load(os.path.join(self.matrix_cache_path, 'X.npy'), mmap_mode='r')
+            y = np.load(os.path.join(self.matrix_cache_path, 'y.npy'), mmap_mode='r')
+            self.label_encoders = joblib.load(os.path.join(self.matrix_cache_path, 'label_encoders.joblib'))
+        except (OSError, ValueError) as e:
+            logging.info(f"No usable encoded training matrix cache: {str(e)}")
+            return None
+        
+        self.category_codes = {
+            column: self.build_category_codes(le)
+            for column, le in self.label_encoders.items()
+        }
+        logging.info(f"Loaded cached encoded training matrix. Shape: {X.shape}")
+        return pd.DataFrame(X, columns=metadata['columns'], copy=False), pd.Series(y)
+    
+    def save_training_matrix(self, key, X, y):
+        """Write the encoded matrix, target and encoders to the cache directory"""
+        parent = os.path.dirname(os.path.abspath(self.matrix_cache_path))
+        staging = tempfile.mkdtemp(prefix='.encoded-', dir=parent)
+        try:
+            np.save(os.path.join(staging, 'X.npy'), X.to_numpy(dtype=np.int32))
+            np.save(os.path.join(staging, 'y.npy'), y.to_numpy(dtype=str))
+            joblib.dump(self.label_encoders, os.path.join(staging, 'label_encoders.joblib'))
+            with open(os.path.join(staging, 'metadata.json'), 'w') as f:
+                json.dump({'key': key, 'columns': X.columns.tolist()}, f)
+            if os.path.exists(self.matrix_cache_path):
+                shutil.rmtree(self.matrix_cache_path)
+            os.rename(staging, self.matrix_cache_path)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+    
+    def split_data(self, X, y):
+        """Split into the training set and the held-out test set"""
+        return train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+    
+    def train_model(self, force=False, params=None, n_jobs=-1):
+        """Train the machine learning model and return its held-out accuracy"""
+        if not force and (os.path.exists(self.model_path) or os.path.exists(self.compact_model_path)):
             logging.info("Model already exists. Skipping training.")
-            return
+            return None
         
         try:
-            # Load data
-            df = self.load_data()
-            if df is None:
-                logging.error("Cannot train model: data loading failed")
-                return
-            
-            logging.info(f"Training data shape: {df.shape}")
-            logging.info(f"Target distribution:\n{df['income'].value_counts()}")
-            
-            # Prepare features and target
-            X = self.preprocess_data(df, is_training=True)
+            X, y = self.prepare_training_data()
             if X is None:
-                logging.error("Data preprocessing failed")
-                return
-                
-            y = df['income'].str.strip()
-            
-            logging.info(f"Processed features shape: {X.shape}")
-            logging.info(f"Features: {X.columns.tolist()}")
+                return None
             
             # Split the data
-            X_train, X_test, y_train, y_test = train_test_split(
-                X, y, test_size=0.2, random_state=42, stratify=y
-            )
-            
-            # Train Random Forest model with better parameters
-            self.model = RandomForestClassifier(
-                n_estimators=200,
-                random_state=42,
-                max_depth=15,
-                min_samples_split=10,
-                min_samples_leaf=4,
-                class_weight='balanced'  # Handle class imbalance
-            )
-            
-            logging.info("Training Random Forest model...")
+            X_train, X_test, y_train, y_test = self.split_data(X, y)
+            
+            # Fit the trees on all cores (n_jobs=-1)
+            self.model = self.build_forest(params, n_jobs=n_jobs)
+            
+            logging.info(f"Training Random Forest model with {self.model.get_params()}...")
             self.model.fit(X_train, y_train)
+            # Serve predictions on one core: thread dispatch per call costs more
+            # than it saves for the small batches the app scores
+            self.model.n_jobs = None
+            self.compile_forest()
             
             # Evaluate the model
             y_pred = self.model.predict(X_test)
@@ -149,44 +388,407 @@ class MLModel:
             
             # Save the model and preprocessors
             self.save_model()
+            return accuracy
             
         except Exception as e:
             logging.error(f"Error training model: {str(e)}")
             import traceback
             logging.error(traceback.format_exc())
+            return None
+    
+    def extend_encoders(self, df):
+        """Label encoders with the categories first seen in df appended.
+        
+        Returns copies; the encoders in use are not modified. New labels go
+        after the existing classes, so every code the forest already uses
+        keeps its meaning. A new label takes the code that used to be the
+        unseen-category sentinel, which older trees already treat as "not
+        seen in training".
+        """
+        label_encoders = {}
+        for column, le in self.label_encoders.items():
+            le = copy.deepcopy(le)
+            values = df[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                seen = values.cat.remove_unused_categories().cat.categories
+            else:
+                seen = pd.Index(values.dropna().unique())
+            new = sorted(set(seen) - set(le.classes_))
+            if new:
+                le.classes_ = np.concatenate([le.classes_, np.asarray(new, dtype=le.classes_.dtype)])
+                logging.info(f"Added {len(new)} new categories to {column}: {new}")
+            label_encoders[column] = le
+        return label_encoders
+    
+    def update_model(self, path, n_new_trees=50, max_trees=None, n_jobs=-1):
+        """Grow the forest with trees fitted on a newly labelled batch.
+        
+        The new trees use the current forest's settings. Once the forest holds
+        more than max_trees trees (default: its current size), the oldest
+        trees are retired, so the forest is a rolling ensemble that tracks the
+        newest data without refitting from scratch. The updated forest and
+        encoders replace the ones in use only once they have been saved.
+        """
+        if self.model is None:
+            if not os.path.exists(self.model_path):
+                raise ValueError("No trained model to update")
+            self.model = joblib.load(self.model_path)
+        max_trees = max_trees or len(self.model.estimators_)
+        
+        df = self.load_data(path)
+        if df is None:
+            raise ValueError(f"Could not load new data from {path}")
+        
+        label_encoders = self.extend_encoders(df)
+        category_codes = {column: self.build_category_codes(le)
+                          for column, le in label_encoders.items()}
+        X = self.preprocess_data(df, is_training=False, category_codes=category_codes)
+        y = df[self.target_column].str.strip()
+        
+        # Seeded from the version being updated, which changes with every
+        # update (a rolling forest keeps the same size, so its tree count
+        # would repeat the same bootstrap and feature sampling each time)
+        seed = int(self.compute_model_version(), 16) % 2**32
+        params = dict(self.model.get_params(), n_estimators=n_new_trees, n_jobs=n_jobs,
+                      random_state=seed)
+        new_forest = RandomForestClassifier(**params)
+        logging.info(f"Fitting {n_new_trees} new trees on {len(X)} samples...")
+        new_forest.fit(X, y)
+        if not np.array_equal(new_forest.classes_, self.model.classes_):
+            raise ValueError(f"The new batch must contain every class: {list(self.model.classes_)}")
+        
+        # A shallow copy shares the kept trees with the forest in use
+        model = copy.copy(self.model)
+        estimators = self.model.estimators_ + new_forest.estimators_
+        retired = max(0, len(estimators) - max_trees)
+        model.estimators_ = estimators[retired:]
+        model.n_estimators = len(model.estimators_)
+        
+        self.write_model_files(model, label_encoders)
+        self.model = model
+        self.label_encoders = label_encoders
+        self.category_codes = category_codes
+        self.compile_forest()
+        self.set_model_version(self.compute_model_version())
+        logging.info(f"Added {n_new_trees} trees, retired the {retired} oldest; "
+                     f"forest now has {self.model.n_estimators} trees")
+        return n_new_trees, retired
+    
+    def encode_record(self, input_data):
+        """Encode a single input record into a 1 x n_features array"""
+        row = np.empty((1, len(self.feature_columns)))
+        for i, column in enumerate(self.feature_columns):
+            value = input_data.get(column)
+            if column in self.category_codes:
+                codes = self.category_codes[column]
+                if pd.isna(value):
+                    value = 'Unknown'
+                row[0, i] = codes.get(value, len(codes))
+            elif isinstance(value, str):
+                row[0, i] = 0
+            else:
+                row[0, i] = value
+        return row
+    
+    def prediction_cache_key(self, X_processed):
+        """Cache key for a single encoded row.
+        
+        The encoded row is exactly what the forest sees, so it is the
+        normalized key; the model version keeps old results out.
+        """
+        return (self.model_version, *X_processed[0])
+    
+    def predict_encoded(self, X_processed):
+        """Labels and confidences for encoded rows from one forest evaluation.
+        
+        The label is the most probable class, exactly as
+        RandomForestClassifier.predict picks it, and the confidence is its
+        probability. Each row's result does not depend on the others in X.
+        """
+        estimator = self.get_estimator()
+        with PREDICTION_STAGE_SECONDS.time('forest'):
+            if self.early_exit_tolerance is not None and self.compiled_forest is not None \
+                    and len(X_processed) >= self.EARLY_EXIT_MIN_BATCH:
+                prediction_proba, trees_used = self.compiled_forest.predict_proba_adaptive(
+                    X_processed, self.early_exit_tolerance, self.EARLY_EXIT_CHUNK_SIZE)
+                PREDICTION_TREES_USED.observe_many(trees_used)
+            else:
+                prediction_proba = predict_proba_array(estimator, X_processed)
+        best = prediction_proba.argmax(axis=1)
+        return estimator.classes_[best], prediction_proba[np.arange(len(best)), best]
     
     def predict(self, input_data):
         """Make prediction for new data"""
         try:
-            if self.model is None:
+            if self.get_estimator() is None:
                 raise ValueError("Model not trained or loaded")
             
-            # Convert input to DataFrame
-            df_input = pd.DataFrame([input_data])
+            # Encode the record directly, without building a DataFrame
+            with PREDICTION_STAGE_SECONDS.time('preprocess'):
+                X_processed = self.encode_record(input_data)
             
-            # Preprocess the input
-            X_processed = self.preprocess_data(df_input, is_training=False)
+            cache_key = self.prediction_cache_key(X_processed)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
             
-            # Make prediction
-            prediction = self.model.predict(X_processed)[0]
-            prediction_proba = self.model.predict_proba(X_processed)[0]
-            
-            # Get confidence (max probability)
-            confidence = float(max(prediction_proba))
+            predictions, confidences = self.predict_encoded(X_processed)
+            prediction, confidence = predictions[0], float(confidences[0])
             
             logging.info(f"Prediction made: {prediction} with confidence: {confidence:.4f}")
             
+            self.cache.put(cache_key, (prediction, confidence))
             return prediction, confidence
             
         except Exception as e:
             logging.error(f"Error making prediction: {str(e)}")
             raise
     
+    def sweep(self, input_data, axes):
+        """Class probabilities over a grid of variations of one record.
+        
+        axes is a list of (feature, values) pairs. The base record is encoded
+        once, each axis's values are encoded once, and the full grid is
+        scored in one forest evaluation. Returns an array of shape
+        (len(values_1), ..., n_classes) and the class labels; each point
+        matches predict() on the corresponding record.
+        """
+        if self.get_estimator() is None:
+            raise ValueError("Model not trained or loaded")
+        
+        with PREDICTION_STAGE_SECONDS.time('preprocess'):
+            base = self.encode_record(input_data)
+            shape = [len(values) for _, values in axes]
+            X_grid = np.repeat(base, int(np.prod(shape)), axis=0)
+            positions = np.indices(shape).reshape(len(axes), -1)
+            for (feature, values), position in zip(axes, positions):
+                if feature in self.category_codes:
+                    codes = self.category_codes[feature]
+                    encoded = np.array([codes.get(value, len(codes)) for value in values])
+                else:
+                    encoded = np.asarray(values, dtype=np.float64)
+                X_grid[:, self.feature_columns.index(feature)] = encoded[position]
+        
+        estimator = self.get_estimator()
+        with PREDICTION_STAGE_SECONDS.time('forest'):
+            prediction_proba = predict_proba_array(estimator, X_grid)
+        logging.info(f"Sweep scored {len(X_grid)} points over {[feature for feature, _ in axes]}")
+        return prediction_proba.reshape(shape + [-1]), estimator.classes_
+    
+    def predict_batch(self, records):
+        """Make predictions for a list of input records in a single model call"""
+        try:
+            if self.get_estimator() is None:
+                raise ValueError("Model not trained or loaded")
+            
+            if not records:
+                return []
+            
+            with PREDICTION_STAGE_SECONDS.time('preprocess'):
+                df_input = pd.DataFrame(records, columns=self.feature_columns)
+                X_processed = self.preprocess_data(df_input, is_training=False)
+            
+            predictions, confidences = self.predict_encoded(X_processed)
+            
+            logging.info(f"Batch prediction made for {len(records)} records")
+            
+            return [(prediction, float(confidence))
+                    for prediction, confidence in zip(predictions, confidences)]
+            
+        except Exception as e:
+            logging.error(f"Error making batch prediction: {str(e)}")
+            raise
+    
+    def set_early_exit(self, tolerance):
+        """Stop evaluating trees once the vote margin settles the label; None turns it off.
+        
+        tolerance 0 only stops when no remaining trees could flip the label;
+        a larger tolerance accepts that probability of a flip. The confidence
+        returned is then the vote share among the trees actually used. Only
+        batches of at least EARLY_EXIT_MIN_BATCH records stop early.
+        Requires the compiled backend.
+        """
+        if tolerance is not None:
+            if self.backend != 'compiled':
+                raise ValueError("Early exit requires the compiled backend")
+            if not 0 <= tolerance < 1:
+                raise ValueError("The early exit tolerance must be in [0, 1)")
+        if tolerance != self.early_exit_tolerance:
+            # Cached confidences were computed with the other setting
+            self.cache.clear()
+        self.early_exit_tolerance = tolerance
+    
+    def set_backend(self, backend):
+        """Switch between the sklearn and compiled inference backends"""
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}")
+        if self.load_mode == 'mmap' and backend != 'compiled':
+            raise ValueError("The mmap load mode requires the compiled backend")
+        if backend != 'compiled' and self.early_exit_tolerance is not None:
+            raise ValueError("Early exit requires the compiled backend")
+        if backend == 'sklearn' and self.model is None and self.compiled_forest is not None:
+            raise ValueError(f"The sklearn backend needs {self.model_path}; "
+                             f"only the compact model is loaded")
+        self.backend = backend
+        self.compile_forest()
+    
+    def compile_forest(self):
+        """Flatten the loaded forest into arrays if the compiled backend is active"""
+        if self.backend != 'compiled':
+            self.compiled_forest = None
+            return
+        if self.model is None:
+            # Nothing to compile, or a memory-mapped forest is already in use
+            return
+        self.compiled_forest = CompiledForest.from_sklearn(self.model)
+        logging.info(f"Compiled forest: {self.compiled_forest.n_estimators} trees, "
+                     f"{len(self.compiled_forest.feature)} nodes")
+    
+    def get_estimator(self):
+        """Return the object that evaluates the forest for the active backend"""
+        if self.compiled_forest is not None:
+            return self.compiled_forest
+        return self.model
+    
+    def compute_model_version(self):
+        """Content hash of the model and encoder files.
+        
+        When only the compact model is present this is the version of the
+        model it was built from, as long as the encoders have not changed.
+        """
+        if os.path.exists(self.model_path):
+            return file_digest(self.model_path, self.encoders_path)[:12]
+        metadata = CompiledForest.read_compact_metadata(self.compact_model_path)
+        if metadata is None:
+            raise ValueError(f"No model found at {self.model_path} or {self.compact_model_path}")
+        if metadata.get('encoders_digest') != file_digest(self.encoders_path)[:12]:
+            raise ValueError(f"{self.compact_model_path} was built with different label encoders")
+        return metadata['model_version']
+    
+    def compact_model_matches(self, version):
+        """True if the compact model file was built from model version"""
+        metadata = CompiledForest.read_compact_metadata(self.compact_model_path)
+        return metadata is not None and metadata.get('model_version') == version
+    
+    def save_compact_model(self, prune=True):
+        """Publish the model with the forest in the compact format alongside it.
+        
+        Published versions are never modified, so the model and encoder files
+        are copied into a new version together with the compact file; its
+        model version is unchanged. Returns the CompiledForest that was saved.
+        """
+        if self.model is None:
+            if not os.path.exists(self.model_path):
+                raise ValueError("No trained model to compact")
+            self.model = joblib.load(self.model_path)
+        forest = CompiledForest.from_sklearn(self.model, prune=prune)
+        model_version = self.compute_model_version()
+        encoders_digest = file_digest(self.encoders_path)[:12]
+        model_path, encoders_path = self.model_path, self.encoders_path
+        
+        def write(staging):
+            shutil.copyfile(model_path, os.path.join(staging, self.MODEL_FILE))
+            shutil.copyfile(encoders_path, os.path.join(staging, self.ENCODERS_FILE))
+            forest.save_compact(os.path.join(staging, self.COMPACT_MODEL_FILE),
+                                model_version=model_version, encoders_digest=encoders_digest,
+                                pruned=prune)
+        self.publish_model_files(write)
+        return forest
+    
+    def published_model_dir(self):
+        """Directory of the version models/CURRENT names, or '' for files in the working directory"""
+        try:
+            with open(os.path.join(self.store_path, 'CURRENT')) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            # Models saved before the store existed sit in the working directory
+            return ''
+        return os.path.join(self.store_path, version)
+    
+    def use_model_dir(self, model_dir):
+        """Point the model file paths at the files in model_dir"""
+        self.model_dir = model_dir
+        self.model_path = os.path.join(model_dir, self.MODEL_FILE)
+        self.encoders_path = os.path.join(model_dir, self.ENCODERS_FILE)
+        self.compact_model_path = os.path.join(model_dir, self.COMPACT_MODEL_FILE)
+    
+    def model_files_signature(self, model_dir=None):
+        """What identifies the published model files, None if there are none.
+        
+        A published version directory is never modified, so the pointer to
+        it is enough. Files in the working directory are identified by their
+        modification time and size. Cheap enough to poll: a change means the
+        version may have changed. model_dir defaults to the published one.
+        """
+        if model_dir is None:
+            model_dir = self.published_model_dir()
+        if model_dir:
+            return (model_dir,)
+        paths = [path for path in (self.MODEL_FILE, self.COMPACT_MODEL_FILE) if os.path.exists(path)]
+        if not paths:
+            return None
+        try:
+            return tuple((path, stat.st_mtime_ns, stat.st_size)
+                         for path, stat in zip(paths + [self.ENCODERS_FILE],
+                                               map(os.stat, paths + [self.ENCODERS_FILE])))
+        except OSError:
+            return None
+    
+    def set_model_version(self, version):
+        """Record the active model version, dropping cached results of any other"""
+        if version != self.model_version:
+            self.cache.clear()
+        self.model_version = version
+    
+    def write_model_files(self, model, label_encoders):
+        """Publish a forest and its label encoders as a new model version; raises on failure.
+        
+        Both files are written to a staging directory, which is renamed to
+        models/<version>. models/CURRENT is then replaced in one step, so a
+        process loading the model sees either the old pair or the new one.
+        """
+        def write(staging):
+            joblib.dump(label_encoders, os.path.join(staging, self.ENCODERS_FILE))
+            joblib.dump(model, os.path.join(staging, self.MODEL_FILE))
+        self.publish_model_files(write)
+    
+    def publish_model_files(self, write):
+        """Publish the files write(staging) puts in a staging directory as a new version.
+        
+        The directory is named after the digest of its files, so a version
+        that also holds a compact model never collides with the one without.
+        """
+        os.makedirs(self.store_path, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.version-', dir=self.store_path)
+        try:
+            write(staging)
+            paths = [os.path.join(staging, name)
+                     for name in (self.MODEL_FILE, self.ENCODERS_FILE, self.COMPACT_MODEL_FILE)]
+            version = file_digest(*[path for path in paths if os.path.exists(path)])[:12]
+            model_dir = os.path.join(self.store_path, version)
+            try:
+                os.rename(staging, model_dir)
+            except OSError:
+                if not os.path.isdir(model_dir):
+                    raise
+                # The same version was published before
+                shutil.rmtree(staging, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        
+        fd, pointer = tempfile.mkstemp(prefix='.CURRENT-', dir=self.store_path)
+        with os.fdopen(fd, 'w') as f:
+            f.write(version + '\n')
+        os.replace(pointer, os.path.join(self.store_path, 'CURRENT'))
+        self.use_model_dir(model_dir)
+        prune_versions(self.store_path, keep=self.VERSIONS_KEPT, current=version)
+    
     def save_model(self):
         """Save the trained model and preprocessors"""
         try:
-            joblib.dump(self.model, self.model_path)
-            joblib.dump(self.label_encoders, self.encoders_path)
+            self.write_model_files(self.model, self.label_encoders)
+            self.set_model_version(self.compute_model_version())
             logging.info("Model and preprocessors saved successfully")
         except Exception as e:
             logging.error(f"Error saving model: {str(e)}")
@@ -194,13 +796,54 @@ class MLModel:
     def load_model(self):
         """Load the trained model and preprocessors"""
         try:
-            if (os.path.exists(self.model_path) and 
+            # Read the pointer once, so the signature matches the files loaded
+            model_dir = self.published_model_dir()
+            self.use_model_dir(model_dir)
+            if ((os.path.exists(self.model_path) or os.path.exists(self.compact_model_path)) and
                 os.path.exists(self.encoders_path)):
                 
-                self.model = joblib.load(self.model_path)
+                start = time.perf_counter()
+                signature = self.model_files_signature(model_dir)
+                version = self.compute_model_version()
+                if self.load_mode == 'mmap':
+                    self.compiled_forest = self.load_mapped_forest(version)
+                elif not os.path.exists(self.model_path) or (
+                        self.backend == 'compiled' and self.compact_model_matches(version)):
+                    # The compact file holds exactly the compiled forest
+                    self.model = None
+                    self.compiled_forest = CompiledForest.load_compact(self.compact_model_path)
+                else:
+                    self.model = joblib.load(self.model_path)
+                    self.compile_forest()
                 self.label_encoders = joblib.load(self.encoders_path)
-                logging.info("Model and preprocessors loaded successfully")
+                self.category_codes = {
+                    column: self.build_category_codes(le)
+                    for column, le in self.label_encoders.items()
+                }
+                self.set_model_version(version)
+                self.loaded_signature = signature
+                self.load_seconds = time.perf_counter() - start
+                logging.info(f"Model and preprocessors loaded successfully (version {self.model_version}) "
+                             f"in {self.load_seconds:.2f}s")
             else:
                 logging.info("Model files not found. Will train new model.")
         except Exception as e:
             logging.error(f"Error loading model: {str(e)}")
+    
+    def load_mapped_forest(self, version):
+        """Memory-map the compiled forest of version, compiling it first if it is missing.
+        
+        Each version is written once to its own directory under forest_path,
+        so workers compiling the same version at the same time cannot
+        disturb one another or a worker that is mapping it.
+        """
+        path = os.path.join(self.forest_path, version)
+        if CompiledForest.read_metadata(path) is None:
+            logging.info("Compiling forest for memory-mapped loading...")
+            if self.compact_model_matches(version):
+                forest = CompiledForest.load_compact(self.compact_model_path)
+            else:
+                forest = CompiledForest.from_sklearn(joblib.load(self.model_path))
+            forest.save(path, model_version=version)
+            prune_versions(self.forest_path, keep=self.VERSIONS_KEPT, current=version)
+        return CompiledForest.load(path, mmap_mode='r')
@@ -0,0 +1,150 @@
+import logging
+import math
+import os
+import threading
+import time
+
+_model = None
+_lock = threading.Lock()
+# Serializes reloads so that two triggers never load the same files twice
+_reload_lock = threading.Lock()
+_watcher_pid = None
+
+# Scored by every candidate model before it is swapped in
+SMOKE_TEST_RECORD = {
+    'age': 39, 'workclass': 'Private', 'education': 'Bachelors',
+    'marital-status': 'Married-civ-spouse', 'occupation': 'Exec-managerial',
+    'relationship': 'Husband', 'race': 'White', 'gender': 'Male',
+    'hours-per-week': 45, 'native-country': 'United-States',
+}
+
+
+def create_model():
+    """Build a new MLModel from the model files, configured from the environment.
+
+      MODEL_BACKEND          'sklearn' (default) or 'compiled'
+      MODEL_LOAD_MODE        'memory' (default) or 'mmap'; mmap implies the
+                             compiled backend
+      PREDICTION_CACHE_SIZE  LRU prediction cache size, 0 disables (default 10000)
+      MODEL_EARLY_EXIT_TOLERANCE
+                             unset (default) evaluates every tree; otherwise
+                             the early-exit vote tolerance, implying the
+                             compiled backend (0: never changes a label)
+    """
+    # Imported here so that importing the web app does not pull in
+    # pandas and scikit-learn before the model is first needed
+    from ml_model import MLModel
+    load_mode = os.environ.get('MODEL_LOAD_MODE', 'memory')
+    backend = os.environ.get('MODEL_BACKEND', 'sklearn')
+    early_exit_tolerance = os.environ.get('MODEL_EARLY_EXIT_TOLERANCE')
+    if load_mode == 'mmap' or early_exit_tolerance is not None:
+        backend = 'compiled'
+    ml_model = MLModel(backend=backend,
+                       cache_size=int(os.environ.get('PREDICTION_CACHE_SIZE', 10000)),
+                       load_mode=load_mode)
+    if early_exit_tolerance is not None:
+        ml_model.set_early_exit(float(early_exit_tolerance))
+    return ml_model
+
+
+def get_model():
+    """Return the process-wide MLModel, creating it on first use.
+
+    Callers should fetch the model once per request and use that reference
+    throughout: a reload swaps in a new instance and never modifies the one
+    a request is already using.
+    """
+    global _model
+    if _model is None:
+        with _lock:
+            if _model is None:
+                _model = create_model()
+    return _model
+
+
+def get_loaded_model():
+    """Return the process-wide MLModel if it has been created, without loading it"""
+    return _model
+
+
+def smoke_test(ml_model):
+    """Raise ValueError unless ml_model scores SMOKE_TEST_RECORD sensibly"""
+    if ml_model.get_estimator() is None:
+        raise ValueError("Model files could not be loaded")
+    prediction, confidence = ml_model.predict(SMOKE_TEST_RECORD)
+    if prediction not in ml_model.get_estimator().classes_ or not 0 <= confidence <= 1 \
+            or math.isnan(confidence):
+        raise ValueError(f"Smoke prediction returned {prediction!r} with confidence {confidence}")
+
+
+def reload_model():
+    """Load the model files into a new MLModel and swap it in if it passes a smoke test.
+
+    The current model keeps serving while the candidate loads, and requests
+    that already hold it finish on it. Returns the active model version and
+    whether it changed; raises ValueError, leaving the current model in
+    place, if the candidate fails to load or to predict.
+    """
+    global _model
+    with _reload_lock:
+        current = get_model()
+        candidate = create_model()
+        if candidate.loaded_signature is None:
+            raise ValueError("Model files could not be loaded; see the log for details")
+        if candidate.model_files_signature() != candidate.loaded_signature:
+            raise ValueError("Model files changed while they were being loaded")
+        if candidate.model_version == current.model_version:
+            # Rewritten with the same contents; remember the new file times
+            current.loaded_signature = candidate.loaded_signature
+            return current.model_version, False
+        smoke_test(candidate)
+        # Rebinding one global is atomic; later get_model() calls see the new model
+        _model = candidate
+        logging.info(f"Swapped model version {current.model_version} for {candidate.model_version}")
+        return candidate.model_version, True
+
+
+def watch_model_files(interval, max_backoff=300):
+    """Reload the model whenever its files change, checking every interval seconds.
+
+    A failed reload is retried with exponential backoff, up to max_backoff
+    seconds apart, until it succeeds; a new publish resets the backoff.
+    """
+    delay = interval
+    failed_signature = None
+    while True:
+        time.sleep(delay)
+        ml_model = get_model()
+        signature = ml_model.model_files_signature()
+        if signature is None or signature == ml_model.loaded_signature:
+            delay = interval
+            continue
+        if signature != failed_signature:
+            delay = interval
+        try:
+            reload_model()
+            delay, failed_signature = interval, None
+        except Exception as e:
+            failed_signature = signature
+            delay = min(delay * 2, max(max_backoff, interval))
+            logging.error(f"Model reload failed, keeping version {ml_model.model_version}; "
+                          f"retrying in {delay:.1f}s: {str(e)}")
+
+
+def start_model_watcher():
+    """Start this process's model file watcher if MODEL_RELOAD_INTERVAL is set.
+
+    Safe to call on every request. The thread is started once per process,
+    so under Gunicorn each forked worker watches the files itself.
+    """
+    global _watcher_pid
+    if _watcher_pid == os.getpid():
+        return
+    with _lock:
+        if _watcher_pid == os.getpid():
+            return
+        _watcher_pid = os.getpid()
+        interval = float(os.environ.get('MODEL_RELOAD_INTERVAL', 0))
+        if interval > 0:
+            threading.Thread(target=watch_model_files, args=(interval,),
+                             name='model-watcher', daemon=True).start()
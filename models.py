@@ -1,5 +1,7 @@
 from app import db
 from flask_login import UserMixin
+from sqlalchemy import event
+from user_cache import invalidate_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 
@@ -22,6 +24,10 @@ class User(UserMixin, db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
+# Keep the user loader's cache in step with changes made through the ORM
+event.listen(User, 'after_update', invalidate_user)
+event.listen(User, 'after_delete', invalidate_user)
+
 class Prediction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -41,8 +47,20 @@ class Prediction(db.Model):
     # Prediction result
     predicted_salary = db.Column(db.String(10), nullable=False)  # <=50K or >50K
     prediction_confidence = db.Column(db.Float)
+    # MLModel.model_version of the model that made the prediction
+    model_version = db.Column(db.String(12))
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        # A user's most recent predictions: WHERE user_id = ? ORDER BY created_at DESC
+        db.Index('ix_prediction_user_created', 'user_id', 'created_at'),
+        # Per-user counts by salary bracket, answered from the index alone, and
+        # history pages filtered by salary bracket in created_at order
+        db.Index('ix_prediction_user_salary_created', 'user_id', 'predicted_salary', 'created_at'),
+        # History pages filtered by occupation in created_at order
+        db.Index('ix_prediction_user_occupation_created', 'user_id', 'occupation', 'created_at'),
+    )
+    
     def __repr__(self):
         return f'<Prediction {self.id}: {self.predicted_salary}>'
@@ -0,0 +1,99 @@
+import logging
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from metrics import DB_QUERIES_PER_REQUEST, DB_TIME_PER_REQUEST_SECONDS
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A request ran more SQL statements than its route's budget allows"""
+
+
+class RequestQueryStats:
+    """SQL statements run while serving one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def repeated(self):
+        """(statement, times run) for identical statements run more than once"""
+        return [(statement, count) for (statement, _), count in self.statements.items()
+                if count > 1]
+
+
+def start_request_stats():
+    """Start counting statements for the request being handled"""
+    g.query_stats = RequestQueryStats()
+
+
+def current_stats():
+    """This request's statistics, or None outside a request"""
+    if not has_request_context():
+        return None
+    stats = g.get('query_stats')
+    if stats is None:
+        stats = g.query_stats = RequestQueryStats()
+    return stats
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    # Keyed by execution context, not a stack, so a statement that fails
+    # cannot leave its start time behind for the next one to be timed from
+    conn.info.setdefault('query_start', {})[context] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop(context)
+    # Background threads (write-behind, CLI commands) have no request to charge
+    stats = current_stats()
+    if stats is None:
+        return
+    stats.count += 1
+    stats.seconds += elapsed
+    if not executemany:
+        # Same text and same parameters: the request asked for the same rows again
+        stats.statements[(statement, repr(parameters))] += 1
+
+    threshold = current_app.config.get('SLOW_QUERY_MS', 0)
+    if threshold and elapsed * 1000 >= threshold:
+        endpoint = request.endpoint or 'unmatched'
+        logging.warning(f"Slow query ({elapsed * 1000:.1f} ms) in {endpoint}: {statement}")
+
+
+@event.listens_for(Engine, 'handle_error')
+def discard_query_timer(exception_context):
+    # A failed statement never reaches after_cursor_execute. Errors raised
+    # outside a statement (connect, fetch, commit) have no start to drop.
+    conn = exception_context.connection
+    if conn is not None:
+        conn.info.get('query_start', {}).pop(exception_context.execution_context, None)
+
+
+def finish_request_stats(endpoint, budget=None, enforce=False):
+    """Report this request's statements and check them against budget.
+
+    Observes the per-route histograms, logs identical statements that ran
+    more than once, and logs a budget overrun, or raises
+    QueryBudgetExceeded when enforce is set. Returns the statistics.
+    Statements a streamed response runs after its first byte are not
+    counted.
+    """
+    stats = g.pop('query_stats', None) or RequestQueryStats()
+    DB_QUERIES_PER_REQUEST.observe(stats.count, endpoint)
+    DB_TIME_PER_REQUEST_SECONDS.observe(stats.seconds, endpoint)
+    for statement, count in stats.repeated():
+        logging.warning(f"Query repeated {count} times in {endpoint}: {statement}")
+    if budget is not None and stats.count > budget:
+        message = f"{endpoint} ran {stats.count} SQL statements, over its budget of {budget}"
+        if enforce:
+            raise QueryBudgetExceeded(message)
+        logging.warning(message)
+    return stats
@@ -1,12 +1,75 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import render_template, redirect, url_for, flash, request, jsonify, Response, stream_with_context, g, abort
 from flask_login import login_user, logout_user, current_user, login_required
 from app import app, db
 from models import User, Prediction
 from forms import LoginForm, RegistrationForm, PredictionForm
-from ml_model import MLModel
-import pandas as pd
+from wtforms import IntegerField
+from wtforms.validators import NumberRange
+from model_registry import get_model, reload_model, start_model_watcher
+from metrics import REQUEST_SECONDS, PREDICTION_STAGE_SECONDS, render_metrics
+from write_behind import get_write_behind_queue
+from micro_batch import get_micro_batcher
+from query_stats import start_request_stats, finish_request_stats
+from sqlalchemy import and_, func, insert, or_, select
+from datetime import datetime, timedelta
+import base64
+import csv
+import hmac
+import io
+import json
+import time
 
-ml_model = MLModel()
+# Upper bound on the number of records accepted by one batch prediction request
+BATCH_PREDICTION_LIMIT = 10000
+
+# Rows fetched per round trip when streaming a prediction export
+EXPORT_BATCH_SIZE = 1000
+
+# Prediction columns written by the export, in output order
+EXPORT_COLUMNS = ['id', 'created_at', 'age', 'workclass', 'education', 'marital_status',
+                  'occupation', 'relationship', 'race', 'gender', 'hours_per_week',
+                  'native_country', 'predicted_salary', 'prediction_confidence', 'model_version']
+
+# Features a sweep may vary at once
+SWEEP_MAX_AXES = 2
+
+# Predictions per history page (the API accepts ?limit= up to the maximum)
+HISTORY_PAGE_SIZE = 25
+HISTORY_MAX_PAGE_SIZE = 200
+
+# Most SQL statements one request to each route may run (see query_stats.py),
+# counting the logged-in user's lookup when the user cache misses
+QUERY_BUDGETS = {
+    'index': 1,
+    'register': 3,
+    'login': 1,
+    'logout': 1,
+    'dashboard': 3,
+    'predict': 2,
+    'predict_batch': 2,
+    'predict_sweep': 1,
+    'history': 2,
+    'predictions_api': 2,
+    'export_predictions': 1,
+    'metrics': 0,
+    'reload_model_files': 0,
+    'prediction_cache_stats': 1,
+    'write_behind_stats': 1,
+}
+
+# Maps PredictionForm field names to the feature names used by the ML model
+FORM_TO_FEATURE = {
+    'age': 'age',
+    'workclass': 'workclass',
+    'education': 'education',
+    'marital_status': 'marital-status',
+    'occupation': 'occupation',
+    'relationship': 'relationship',
+    'race': 'race',
+    'gender': 'gender',
+    'hours_per_week': 'hours-per-week',
+    'native_country': 'native-country'
+}
 
 @app.route('/')
 def index():
@@ -57,15 +120,45 @@ def logout():
     flash('You have been logged out.', 'info')
     return redirect(url_for('index'))
 
-@app.route('/dashboard')
-@login_required
-def dashboard():
-    recent_predictions = Prediction.query.filter_by(user_id=current_user.id)\
+def prediction_row(data, prediction, confidence, model_version):
+    """Column values for a Prediction row from PredictionForm field data"""
+    row = {field: data[field] for field in FORM_TO_FEATURE}
+    row.update(user_id=current_user.id,
+               predicted_salary=str(prediction),
+               prediction_confidence=confidence,
+               model_version=model_version,
+               created_at=datetime.utcnow())
+    return row
+
+def save_predictions(rows):
+    """Insert Prediction rows, through the write-behind queue when it is enabled"""
+    queue = get_write_behind_queue()
+    if queue is not None:
+        # Rows the queue could not take (full or shutting down) are written now
+        rows = queue.put_many(rows)
+    if rows:
+        db.session.execute(insert(Prediction), rows)
+        db.session.commit()
+
+def dashboard_stats(user_id):
+    """Recent predictions plus total and >50K counts for the dashboard"""
+    recent_predictions = Prediction.query.filter_by(user_id=user_id)\
                                         .order_by(Prediction.created_at.desc())\
                                         .limit(10).all()
     
-    total_predictions = Prediction.query.filter_by(user_id=current_user.id).count()
-    high_salary_predictions = Prediction.query.filter_by(user_id=current_user.id, predicted_salary='>50K').count()
+    # Both counts from one grouped aggregate over the (user_id, predicted_salary) index
+    salary_counts = dict(db.session.query(Prediction.predicted_salary, func.count())
+                                   .filter(Prediction.user_id == user_id)
+                                   .group_by(Prediction.predicted_salary).all())
+    total_predictions = sum(salary_counts.values())
+    high_salary_predictions = salary_counts.get('>50K', 0)
+    
+    return recent_predictions, total_predictions, high_salary_predictions
+
+@app.route('/dashboard')
+@login_required
+def dashboard():
+    recent_predictions, total_predictions, high_salary_predictions = dashboard_stats(current_user.id)
     
     return render_template('dashboard.html', 
                          recent_predictions=recent_predictions,
@@ -77,7 +170,9 @@ def dashboard():
 def predict():
     form = PredictionForm()
     
-    if form.validate_on_submit():
+    with PREDICTION_STAGE_SECONDS.time('validate'):
+        submitted = form.validate_on_submit()
+    if submitted:
         # Prepare data for prediction
         input_data = {
             'age': form.age.data,
@@ -93,27 +188,18 @@ def predict():
         }
         
         try:
-            # Make prediction
-            prediction, confidence = ml_model.predict(input_data)
+            # Make prediction; a model reload does not affect this request's instance
+            ml_model = get_model()
+            batcher = get_micro_batcher()
+            if batcher is not None:
+                prediction, confidence = batcher.predict(ml_model, input_data)
+            else:
+                prediction, confidence = ml_model.predict(input_data)
             
             # Save prediction to database
-            pred_record = Prediction()
-            pred_record.user_id = current_user.id
-            pred_record.age = form.age.data
-            pred_record.workclass = form.workclass.data
-            pred_record.education = form.education.data
-            pred_record.marital_status = form.marital_status.data
-            pred_record.occupation = form.occupation.data
-            pred_record.relationship = form.relationship.data
-            pred_record.race = form.race.data
-            pred_record.gender = form.gender.data
-            pred_record.hours_per_week = form.hours_per_week.data
-            pred_record.native_country = form.native_country.data
-            pred_record.predicted_salary = prediction
-            pred_record.prediction_confidence = confidence
-            
-            db.session.add(pred_record)
-            db.session.commit()
+            with PREDICTION_STAGE_SECONDS.time('save'):
+                save_predictions([prediction_row(form.data, prediction, confidence,
+                                                 ml_model.model_version)])
             
             flash(f'Prediction successful! Predicted salary bracket: {prediction}', 'success')
             return render_template('predict.html', form=form, prediction=prediction, confidence=confidence)
@@ -123,6 +209,372 @@ def predict():
     
     return render_template('predict.html', form=form)
 
+@app.route('/api/predict/batch', methods=['POST'])
+@login_required
+def predict_batch():
+    records = request.get_json(silent=True)
+    if not isinstance(records, list):
+        return jsonify({'error': 'Request body must be a JSON array of records'}), 400
+    if len(records) > BATCH_PREDICTION_LIMIT:
+        return jsonify({'error': f'At most {BATCH_PREDICTION_LIMIT} records per request'}), 400
+    
+    # Validate every record against the same fields and choices as the web form
+    results = [None] * len(records)
+    valid = []
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            results[index] = {'index': index, 'errors': {'record': ['Record must be a JSON object']}}
+            continue
+        form, errors = validate_record(record)
+        if errors:
+            results[index] = {'index': index, 'errors': errors}
+        else:
+            valid.append((index, {field: form[field].data for field in FORM_TO_FEATURE}))
+    
+    try:
+        # Score all valid records with one model call
+        input_data = [{FORM_TO_FEATURE[field]: value for field, value in data.items()}
+                      for _, data in valid]
+        ml_model = get_model()
+        predictions = ml_model.predict_batch(input_data)
+        
+        rows = []
+        for (index, data), (prediction, confidence) in zip(valid, predictions):
+            rows.append(prediction_row(data, prediction, confidence, ml_model.model_version))
+            results[index] = {'index': index,
+                              'predicted_salary': prediction,
+                              'confidence': confidence}
+        
+        # Save all predictions in one bulk insert
+        save_predictions(rows)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Error making predictions: {str(e)}'}), 500
+    
+    return jsonify({'results': results,
+                    'scored': len(valid),
+                    'failed': len(records) - len(valid)})
+
+def is_integer(value):
+    """True for a JSON integer; bool is an int subclass but not a number here"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def validate_record(record):
+    """PredictionForm for a JSON record and its errors by field (empty if valid).
+    
+    Given data= instead of form data, IntegerField passes values through
+    int(), which would take true, 45.9 or "39"; the web form rejects those,
+    so the API does too.
+    """
+    form = PredictionForm(formdata=None, data=record, meta={'csrf': False})
+    errors = {} if form.validate() else dict(form.errors)
+    for field in form:
+        if isinstance(field, IntegerField) and field.name in record \
+                and not is_integer(record[field.name]):
+            errors[field.name] = ['Must be a whole number']
+    return form, errors
+
+def sweep_axis(spec):
+    """(form field, values) for one axis of a sweep request; raises ValueError if invalid.
+    
+    An axis is {"feature": field, "values": [...]} or, for the numeric fields,
+    {"feature": field, "start": a, "stop": b, "step": c} with stop included.
+    Values are checked against the same choices and ranges as the form, and
+    a range is checked before it is expanded.
+    """
+    if not isinstance(spec, dict) or spec.get('feature') not in FORM_TO_FEATURE:
+        raise ValueError(f"Each axis needs a feature, one of: {', '.join(FORM_TO_FEATURE)}")
+    field = spec['feature']
+    unbound = getattr(PredictionForm, field)
+    choices = unbound.kwargs.get('choices')
+    limits = None if choices is not None else next(
+        validator for validator in unbound.kwargs['validators'] if isinstance(validator, NumberRange))
+    if 'values' in spec:
+        values = spec['values']
+        if not isinstance(values, list) or not values:
+            raise ValueError(f'{field}: values must be a non-empty list')
+        if len(values) > BATCH_PREDICTION_LIMIT:
+            raise ValueError(f'{field}: at most {BATCH_PREDICTION_LIMIT} values')
+    elif choices is None and all(key in spec for key in ('start', 'stop')):
+        start, stop, step = spec['start'], spec['stop'], spec.get('step', 1)
+        if not all(is_integer(number) for number in (start, stop, step)) or step <= 0:
+            raise ValueError(f'{field}: start, stop and step must be integers, with step > 0')
+        if not limits.min <= start <= stop <= limits.max:
+            raise ValueError(f'{field}: start and stop must satisfy '
+                             f'{limits.min} <= start <= stop <= {limits.max}')
+        values = range(start, stop + 1, step)
+        if len(values) > BATCH_PREDICTION_LIMIT:
+            raise ValueError(f'{field}: at most {BATCH_PREDICTION_LIMIT} values')
+        values = list(values)
+    else:
+        raise ValueError(f'{field}: give values' + ('' if choices else ', or start and stop'))
+    
+    if choices is not None:
+        allowed = {value for value, _ in choices}
+        invalid = [value for value in values if not isinstance(value, str) or value not in allowed]
+    else:
+        invalid = [value for value in values
+                   if not is_integer(value) or not limits.min <= value <= limits.max]
+    if invalid:
+        raise ValueError(f'{field}: invalid values {invalid[:5]}')
+    return field, values
+
+@app.route('/api/predict/sweep', methods=['POST'])
+@login_required
+def predict_sweep():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get('profile'), dict):
+        return jsonify({'error': 'Request body must be a JSON object with a profile'}), 400
+    
+    form, errors = validate_record(body['profile'])
+    if errors:
+        return jsonify({'error': 'Invalid profile', 'errors': errors}), 400
+    
+    specs = body.get('vary')
+    if not isinstance(specs, list) or not 1 <= len(specs) <= SWEEP_MAX_AXES:
+        return jsonify({'error': f'vary must list 1 to {SWEEP_MAX_AXES} axes'}), 400
+    try:
+        axes = [sweep_axis(spec) for spec in specs]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if len({field for field, _ in axes}) != len(axes):
+        return jsonify({'error': 'Each feature can be varied only once'}), 400
+    points = 1
+    for _, values in axes:
+        points *= len(values)
+    if points > BATCH_PREDICTION_LIMIT:
+        return jsonify({'error': f'At most {BATCH_PREDICTION_LIMIT} grid points per sweep'}), 400
+    
+    try:
+        # Scored in one forest call and not saved as Prediction rows
+        ml_model = get_model()
+        profile = {FORM_TO_FEATURE[field]: form[field].data for field in FORM_TO_FEATURE}
+        probabilities, classes = ml_model.sweep(
+            profile, [(FORM_TO_FEATURE[field], values) for field, values in axes])
+    except Exception as e:
+        return jsonify({'error': f'Error running sweep: {str(e)}'}), 500
+    
+    return jsonify({
+        'model_version': ml_model.model_version,
+        'axes': [{'feature': field, 'values': values} for field, values in axes],
+        'classes': [str(label) for label in classes],
+        'probabilities': {str(label): probabilities[..., index].tolist()
+                          for index, label in enumerate(classes)},
+        'predicted_salary': classes[probabilities.argmax(axis=-1)].tolist(),
+    })
+
+def encode_cursor(prediction):
+    """Opaque keyset cursor for the position just after a prediction"""
+    key = json.dumps([prediction.created_at.isoformat(), prediction.id])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+def decode_cursor(cursor):
+    """Return (created_at, id) from a cursor; raises ValueError if it is malformed"""
+    try:
+        created_at, prediction_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(prediction_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def history_page(user_id, cursor=None, salary=None, occupation=None, limit=HISTORY_PAGE_SIZE):
+    """One page of a user's predictions, newest first, and the cursor of the next page.
+    
+    Pages are keyed on (created_at, id) rather than OFFSET, so every page is an
+    index range scan that starts where the previous one ended and costs the
+    same at any depth.
+    """
+    query = Prediction.query.filter(Prediction.user_id == user_id)
+    if salary:
+        query = query.filter(Prediction.predicted_salary == salary)
+    if occupation:
+        query = query.filter(Prediction.occupation == occupation)
+    if cursor:
+        created_at, prediction_id = decode_cursor(cursor)
+        query = query.filter(Prediction.created_at <= created_at,
+                             or_(Prediction.created_at < created_at,
+                                 and_(Prediction.created_at == created_at,
+                                      Prediction.id < prediction_id)))
+    predictions = query.order_by(Prediction.created_at.desc(), Prediction.id.desc())\
+                       .limit(limit + 1).all()
+    next_cursor = encode_cursor(predictions[limit - 1]) if len(predictions) > limit else None
+    return predictions[:limit], next_cursor
+
+def history_args():
+    """Filters and cursor shared by the history page and API"""
+    return {
+        'cursor': request.args.get('cursor') or None,
+        'salary': request.args.get('salary') or None,
+        'occupation': request.args.get('occupation') or None,
+    }
+
+@app.route('/history')
+@login_required
+def history():
+    args = history_args()
+    try:
+        predictions, next_cursor = history_page(current_user.id, **args)
+    except ValueError:
+        flash('That page link is no longer valid.', 'warning')
+        return redirect(url_for('history'))
+    
+    return render_template('history.html',
+                         predictions=predictions,
+                         next_cursor=next_cursor,
+                         salary=args['salary'],
+                         occupation=args['occupation'],
+                         occupations=PredictionForm.occupation.kwargs['choices'])
+
+@app.route('/api/predictions')
+@login_required
+def predictions_api():
+    try:
+        limit = min(int(request.args.get('limit', HISTORY_PAGE_SIZE)), HISTORY_MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': f'limit must be between 1 and {HISTORY_MAX_PAGE_SIZE}'}), 400
+    try:
+        predictions, next_cursor = history_page(current_user.id, limit=limit, **history_args())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'predictions': [{column: getattr(prediction, column) for column in EXPORT_COLUMNS}
+                        for prediction in predictions],
+        'next_cursor': next_cursor
+    })
+
+def parse_date_arg(name, end_of_day=False):
+    """Parse an ISO date or datetime query argument; a bare end date includes that whole day"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+@app.route('/predictions/export')
+@login_required
+def export_predictions():
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'error': "format must be 'csv' or 'ndjson'"}), 400
+    try:
+        start = parse_date_arg('start')
+        end = parse_date_arg('end', end_of_day=True)
+    except ValueError:
+        return jsonify({'error': 'start and end must be ISO dates (YYYY-MM-DD)'}), 400
+    
+    # Range scan over the (user_id, created_at) index
+    columns = [getattr(Prediction, name) for name in EXPORT_COLUMNS]
+    query = select(*columns).where(Prediction.user_id == current_user.id)
+    if start:
+        query = query.where(Prediction.created_at >= start)
+    if end:
+        query = query.where(Prediction.created_at < end)
+    query = query.order_by(Prediction.created_at, Prediction.id)
+    
+    def generate():
+        # yield_per streams from a server-side cursor, EXPORT_BATCH_SIZE rows at a time
+        result = db.session.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        try:
+            if export_format == 'csv':
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(EXPORT_COLUMNS)
+                for rows in result.partitions():
+                    writer.writerows(rows)
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                if buffer.tell():
+                    yield buffer.getvalue()
+            else:
+                for rows in result.partitions():
+                    yield ''.join(json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=str) + '\n'
+                                  for row in rows)
+        finally:
+            result.close()
+    
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=predictions.{export_format}'
+    })
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.before_request
+def start_query_stats():
+    start_request_stats()
+
+@app.before_request
+def watch_model():
+    # Started from the first request so that only serving processes watch
+    start_model_watcher()
+
+@app.after_request
+def record_request_duration(response):
+    # Streamed bodies are timed up to the first byte, not until they finish
+    start = g.pop('request_start', None)
+    if start is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                request.endpoint or 'unmatched', request.method,
+                                str(response.status_code))
+    return response
+
+@app.after_request
+def record_query_stats(response):
+    endpoint = request.endpoint or 'unmatched'
+    finish_request_stats(endpoint, QUERY_BUDGETS.get(endpoint),
+                         enforce=app.config.get('QUERY_BUDGET_ENFORCE', False))
+    return response
+
+@app.route('/metrics')
+def metrics():
+    # Prometheus scrapes without a session; METRICS_TOKEN, when set, is
+    # required as a bearer token instead
+    token = app.config.get('METRICS_TOKEN')
+    if token and not has_bearer_token(token):
+        abort(401)
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+def has_bearer_token(token):
+    return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+@app.route('/api/model/reload', methods=['POST'])
+def reload_model_files():
+    # Reloads the worker that receives the request; MODEL_RELOAD_INTERVAL
+    # makes every worker pick up new files on its own
+    token = app.config.get('MODEL_ADMIN_TOKEN')
+    if not token:
+        abort(404)
+    if not has_bearer_token(token):
+        abort(401)
+    previous = get_model().model_version
+    try:
+        version, swapped = reload_model()
+    except Exception as e:
+        return jsonify({'error': f'Model reload failed: {str(e)}',
+                        'model_version': previous}), 500
+    return jsonify({'model_version': version, 'previous_version': previous, 'swapped': swapped})
+
+@app.route('/api/model/cache')
+@login_required
+def prediction_cache_stats():
+    ml_model = get_model()
+    return jsonify(dict(ml_model.cache.stats(), model_version=ml_model.model_version))
+
+@app.route('/api/write-behind')
+@login_required
+def write_behind_stats():
+    queue = get_write_behind_queue()
+    if queue is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(queue.stats(), enabled=True))
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('404.html'), 404
@@ -54,6 +54,16 @@ def check_dependencies():
     print("✓ All required packages installed")
     return True
 
+def run_setup_commands():
+    """Run the init-db and train-model Flask commands"""
+    for command in ('init-db', 'train-model'):
+        result = subprocess.run([sys.executable, '-m', 'flask', '--app', 'main', command])
+        if result.returncode != 0:
+            print(f"✗ 'flask --app main {command}' failed")
+            return False
+    print("✓ Database tables and model ready")
+    return True
+
 def main():
     print("Employee Salary Prediction - Local Development Server")
     print("=" * 55)
@@ -72,7 +82,13 @@ def main():
     os.environ['FLASK_ENV'] = 'development'
     os.environ['SESSION_SECRET'] = 'dev-secret-key-change-in-production'
     
-    print("\n3. Starting Flask development server...")
+    # The app no longer creates tables or trains at import; both commands
+    # are no-ops when the tables and a trained model already exist
+    print("\n3. Creating tables and training the model (first run takes 1-2 minutes)...")
+    if not run_setup_commands():
+        sys.exit(1)
+    
+    print("\n4. Starting Flask development server...")
     print("   Server will be available at: http://localhost:5000")
     print("   Press Ctrl+C to stop the server")
     print("-" * 55)
@@ -82,7 +82,9 @@ def main():
     
     print("\n" + "=" * 50)
     print("✓ Database setup completed successfully!")
-    print("✓ You can now run the Flask application with: python main.py")
+    print("✓ Next, create the tables with: flask --app main init-db")
+    print("✓ Train the model with: flask --app main train-model (takes 1-2 minutes)")
+    print("✓ Then run the Flask application with: python main.py")
     print("✓ The app will be available at: http://localhost:5000")
 
 if __name__ == "__main__":
@@ -0,0 +1,69 @@
+import itertools
+import logging
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from sklearn.model_selection import cross_validate
+
+from ml_model import MLModel
+
+# Forest settings tried by the hyperparameter search
+DEFAULT_PARAM_GRID = {
+    'n_estimators': [100, 200],
+    'max_depth': [10, 15, 20],
+    'min_samples_leaf': [2, 4]
+}
+
+# Training data for the search worker processes, set once per process
+_X_train = None
+_y_train = None
+
+
+def _init_worker(X_train, y_train):
+    global _X_train, _y_train
+    _X_train, _y_train = X_train, y_train
+
+
+def _evaluate(params, cv):
+    """Cross-validate one forest configuration on a single core"""
+    start = time.perf_counter()
+    scores = cross_validate(MLModel.build_forest(params, n_jobs=1), _X_train, _y_train,
+                            cv=cv, scoring='accuracy', return_estimator=True)
+    return {
+        'params': params,
+        'accuracy': float(scores['test_score'].mean()),
+        'fit_seconds': float(scores['fit_time'].mean()),
+        'wall_seconds': time.perf_counter() - start,
+        'model_bytes': len(pickle.dumps(scores['estimator'][0])),
+    }
+
+
+def expand_grid(param_grid):
+    """Turn {'name': [values]} into a list of parameter dicts"""
+    names = list(param_grid)
+    return [dict(zip(names, values))
+            for values in itertools.product(*(param_grid[name] for name in names))]
+
+
+def search_hyperparameters(ml_model, param_grid=None, cv=3, processes=None):
+    """Cross-validate every configuration in parallel, best accuracy first.
+
+    Only the training split is used, so the held-out test set that
+    train_model reports on stays unseen by the search.
+    """
+    X, y = ml_model.prepare_training_data()
+    if X is None:
+        return []
+    X_train, _, y_train, _ = ml_model.split_data(X, y)
+
+    configs = expand_grid(param_grid or DEFAULT_PARAM_GRID)
+    processes = min(processes or os.cpu_count() or 1, len(configs))
+    logging.info(f"Evaluating {len(configs)} configurations on {processes} processes...")
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                             initargs=(X_train, y_train)) as executor:
+        results = list(executor.map(_evaluate, configs, itertools.repeat(cv)))
+
+    return sorted(results, key=lambda result: result['accuracy'], reverse=True)
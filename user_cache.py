@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+
+_cache = None
+_lock = threading.Lock()
+
+
+class CachedUser(UserMixin):
+    """Identity fields of a User, detached from any database session.
+
+    This is what current_user holds when the user cache is enabled. It has
+    no password hash and no relationships; query Prediction by
+    current_user.id rather than through current_user.predictions.
+    """
+
+    __slots__ = ('id', 'username', 'email', 'created_at')
+
+    def __init__(self, id, username, email, created_at):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.created_at = created_at
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.username, user.email, user.created_at)
+
+    def __repr__(self):
+        return f'<User {self.username}>'
+
+
+class UserCache:
+    """Thread-safe LRU cache of CachedUser records that expire after ttl seconds"""
+
+    def __init__(self, ttl=60, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id):
+        """Return the cached record for user_id, or None if absent or expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= now:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id, record):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, record)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def get_user_cache():
+    """Return this process's user cache, or None when USER_CACHE_TTL is 0"""
+    global _cache
+    from app import app
+    ttl = app.config.get('USER_CACHE_TTL', 0)
+    if ttl <= 0:
+        return None
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = UserCache(ttl=ttl)
+    return _cache
+
+
+def load_user(user_id):
+    """User loader for Flask-Login that avoids a database query while the record is cached"""
+    from models import User
+    cache = get_user_cache()
+    if cache is None:
+        return User.query.get(user_id)
+    record = cache.get(user_id)
+    if record is None:
+        user = User.query.get(user_id)
+        if user is None:
+            return None
+        record = CachedUser.from_user(user)
+        cache.put(user_id, record)
+    return record
+
+
+def invalidate_user(mapper, connection, target):
+    """Drop a changed or deleted User from this process's cache.
+
+    Other worker processes keep their copy until its TTL runs out.
+    """
+    if _cache is not None:
+        _cache.invalidate(target.id)
@@ -0,0 +1,193 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from sqlalchemy import insert
+
+_queue = None
+_lock = threading.Lock()
+
+
+class WriteBehindQueue:
+    """Bounded in-process queue of rows that a background thread inserts in batches.
+
+    put() blocks for at most put_timeout seconds when the queue is full and
+    then returns False, so callers can fall back to a synchronous write
+    (backpressure instead of unbounded memory); put_many() does the same for
+    a whole batch under one deadline. stop() flushes whatever is
+    still queued; it is registered to run at interpreter exit.
+
+    A batch whose insert fails is rolled back and retried up to max_retries
+    times with exponential backoff, then inserted row by row so that one
+    bad row cannot lose the rest. Rows that still fail are dropped, logged
+    and counted.
+    """
+
+    def __init__(self, app, db, model, maxsize=10000, batch_size=500,
+                 flush_interval=0.5, put_timeout=0.5, max_retries=3, retry_delay=0.5):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._stats_lock = threading.Lock()
+        self.enqueued = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.retries = 0
+        self.dropped = 0
+        self.batches = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+        self.last_flush_seconds = 0.0
+
+    def start(self):
+        self._thread.start()
+        atexit.register(self.stop)
+        return self
+
+    def put(self, row):
+        """Queue a row for insertion; False if the queue stayed full or is stopped"""
+        if self._stop.is_set():
+            return False
+        try:
+            self._queue.put(row, timeout=self.put_timeout)
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            return False
+        with self._stats_lock:
+            self.enqueued += 1
+        return True
+
+    def put_many(self, rows):
+        """Queue rows in order; return the ones not queued, for a synchronous write.
+
+        The whole batch shares one put_timeout deadline, and once one row is
+        rejected the rest are returned without waiting, so a full queue
+        delays a request by at most put_timeout however many rows it has.
+        """
+        if self._stop.is_set():
+            return list(rows)
+        deadline = time.monotonic() + self.put_timeout
+        queued = 0
+        try:
+            for row in rows:
+                self._queue.put(row, timeout=max(deadline - time.monotonic(), 0))
+                queued += 1
+        except queue.Full:
+            pass
+        rest = list(rows[queued:])
+        with self._stats_lock:
+            self.enqueued += queued
+            self.rejected += len(rest)
+        return rest
+
+    def stop(self, timeout=30):
+        """Stop accepting rows and flush everything still queued"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _insert(self, rows):
+        with self.app.app_context():
+            try:
+                self.db.session.execute(insert(self.model), rows)
+                self.db.session.commit()
+            except Exception:
+                self.db.session.rollback()
+                raise
+
+    def _flush(self, rows):
+        start = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+                with self._stats_lock:
+                    self.retries += 1
+            try:
+                self._insert(rows)
+                flushed = len(rows)
+                break
+            except Exception as e:
+                logging.warning(f"Write-behind flush of {len(rows)} rows failed "
+                                f"(attempt {attempt + 1}): {str(e)}")
+        else:
+            flushed = 0
+            for row in rows:
+                try:
+                    self._insert([row])
+                    flushed += 1
+                except Exception as e:
+                    logging.error(f"Write-behind dropped a prediction row: {str(e)}")
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self.flushed += flushed
+            self.dropped += len(rows) - flushed
+            self.batches += 1
+            self.flush_seconds_total += elapsed
+            self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+            self.last_flush_seconds = elapsed
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'queue_capacity': self._queue.maxsize,
+                'enqueued': self.enqueued,
+                'rejected': self.rejected,
+                'flushed': self.flushed,
+                'retries': self.retries,
+                'dropped': self.dropped,
+                'batches': self.batches,
+                'flush_ms_avg': (self.flush_seconds_total / self.batches * 1000
+                                 if self.batches else 0.0),
+                'flush_ms_max': self.flush_seconds_max * 1000,
+                'flush_ms_last': self.last_flush_seconds * 1000,
+            }
+
+
+def get_write_behind_queue():
+    """Return this process's write-behind queue, or None when the mode is disabled.
+
+    The queue and its thread are created on first use, so that under
+    gunicorn each forked worker starts its own flusher.
+    """
+    global _queue
+    from app import app, db
+    if not app.config.get('PREDICTION_WRITE_BEHIND'):
+        return None
+    if _queue is None:
+        with _lock:
+            if _queue is None:
+                from models import Prediction
+                _queue = WriteBehindQueue(
+                    app, db, Prediction,
+                    maxsize=app.config.get('PREDICTION_WRITE_BEHIND_QUEUE_SIZE', 10000),
+                    batch_size=app.config.get('PREDICTION_WRITE_BEHIND_BATCH_SIZE', 500),
+                ).start()
+    return _queue